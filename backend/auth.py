@@ -1,12 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from models import User, UserRole
+from cache import TTLCache
 import os
+import asyncio
+import threading
+import uuid
 import logging
 
 # Logger setup
@@ -16,10 +22,26 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Authorize from signed token claims without loading the user from MongoDB
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() in ("1", "true", "yes")
+REVOCATION_RELOAD_SECONDS = float(os.getenv("REVOCATION_RELOAD_SECONDS", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a worker before rejecting with 503; 0 means unbounded
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# Token subject -> User; anything that writes to users must call invalidate_user
+user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(user_id: str) -> None:
+    user_cache.discard(user_id)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,18 +50,101 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so it never blocks the event loop"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self.submitted - self.started
+
+    def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self.started += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.finished += 1
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self.max_queue and self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server busy, please retry shortly",
+                    headers={"Retry-After": "1"}
+                )
+            self.submitted += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, *args)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.submitted - self.started,
+                "active": self.started - self.finished,
+                "peak_queue_depth": self.peak_queue_depth,
+                "completed": self.finished,
+                "rejected": self.rejected,
+            }
+
+
+password_hasher = PasswordHasher()
+
+
+def user_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Signed claims carrying everything UserResponse needs"""
+    role = user["role"]
+    return {
+        "sub": user["id"],
+        "role": role.value if isinstance(role, UserRole) else role,
+        "name": user["name"],
+        "email": user["email"],
+        "avatar": user.get("avatar"),
+        "provider": user.get("provider"),
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     if "sub" not in data:
         raise ValueError("Token payload must include 'sub' (user ID)")
     
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access", "jti": uuid.uuid4().hex})
     
     token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     logger.debug(f"Created token for user_id={data['sub']}")
     return token
 
+def create_refresh_token(user_id: str) -> str:
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": user_id, "exp": expire, "type": "refresh", "jti": uuid.uuid4().hex}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
 def decode_token(token: str) -> dict:
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -51,20 +156,128 @@ def decode_token(token: str) -> dict:
         )
 
 
+class RevocationList:
+    """Revoked token ids, held in memory and reloaded periodically from MongoDB.
+
+    Revocations made by another worker take effect here within
+    REVOCATION_RELOAD_SECONDS, without a database hit per request.
+    """
+
+    def __init__(self, reload_seconds: float = REVOCATION_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._revoked: Set[str] = set()
+        self._recent: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.rejected = 0
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if jti and jti in self._revoked:
+            self.rejected += 1
+            return True
+        return False
+
+    async def revoke(self, db: AsyncIOMotorDatabase, payload: Dict[str, Any]) -> bool:
+        """Revoke the token; False if it was already revoked, by this or another worker"""
+        jti = payload.get("jti")
+        if not jti:
+            return False
+        self._revoked.add(jti)
+        self._recent.add(jti)
+        try:
+            result = await db.revoked_tokens.update_one(
+                {"jti": jti},
+                {"$setOnInsert": {
+                    "jti": jti,
+                    "user_id": payload.get("sub"),
+                    "expires_at": datetime.utcfromtimestamp(payload["exp"]),
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent revoke inserted it first
+            return False
+        return result.upserted_id is not None
+
+    async def reload(self, db: AsyncIOMotorDatabase) -> None:
+        # Revocations made while the query runs are kept alongside its result
+        self._recent = set()
+        # Expired entries are removed by the TTL index on expires_at
+        cursor = db.revoked_tokens.find({"expires_at": {"$gt": datetime.utcnow()}}, {"_id": 0, "jti": 1})
+        loaded = {doc["jti"] async for doc in cursor}
+        self._revoked = loaded | self._recent
+        self.reloads += 1
+
+    async def _reload_forever(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                await self.reload(db)
+            except Exception:
+                logger.exception("Reloading revoked tokens failed")
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        await self.reload(db)
+        self._task = asyncio.create_task(self._reload_forever(db))
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"revoked": len(self._revoked), "reloads": self.reloads, "rejected": self.rejected}
+
+
+revocation_list = RevocationList()
+
+
+def verify_token(token: str, token_type: str) -> Dict[str, Any]:
+    """Decode a token and check its type, subject and revocation status"""
+    payload = decode_token(token)
+    
+    # Tokens issued before typed tokens existed are access tokens
+    if payload.get("type", "access") != token_type:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token type"
+        )
+    if not payload.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token missing subject (user ID)"
+        )
+    if revocation_list.is_revoked(payload.get("jti")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
+        )
+    return payload
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncIOMotorDatabase = None
 ) -> User:
     token = credentials.credentials
-    payload = decode_token(token)
-
-    user_id: str = payload.get("sub")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token missing subject (user ID)"
+    payload = verify_token(token, "access")
+    user_id: str = payload["sub"]
+    
+    # Fast path: the signed claims are enough to build the user
+    if AUTH_STATELESS and "role" in payload and "email" in payload:
+        return User(
+            id=user_id,
+            name=payload["name"],
+            email=payload["email"],
+            role=payload["role"],
+            avatar=payload.get("avatar"),
+            provider=payload.get("provider")
         )
     
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    version = user_cache.version
+    
     user_doc = await db.users.find_one({"id": user_id})
     if user_doc is None:
         raise HTTPException(
@@ -72,8 +285,10 @@ async def get_current_user(
             detail="User not found"
         )
 
-    logger.info(f"Authenticated user: {user_id}")
-    return User(**user_doc)
+    logger.debug(f"Authenticated user: {user_id}")
+    user = User(**user_doc)
+    user_cache.set(user_id, user, version)
+    return user
 
 async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
     if current_user.role != UserRole.ADMIN:
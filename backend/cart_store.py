@@ -0,0 +1,466 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from models import CartItem
+from datetime import datetime
+import asyncio
+import copy
+import logging
+import os
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# "mongo" writes every mutation through; "write-behind" keeps carts in memory
+CART_STORE = os.getenv("CART_STORE", "mongo")
+CART_FLUSH_INTERVAL_SECONDS = float(os.getenv("CART_FLUSH_INTERVAL_SECONDS", "2"))
+CART_FLUSH_BATCH_SIZE = int(os.getenv("CART_FLUSH_BATCH_SIZE", "500"))
+# Clean carts untouched for this long are dropped from memory after a flush
+CART_IDLE_SECONDS = float(os.getenv("CART_IDLE_SECONDS", "1800"))
+# Attempts before giving up on a cart that keeps changing underneath us
+CART_UPDATE_RETRIES = 5
+# Recent order ids kept on a cart so a redelivered order.placed is skipped
+CART_CHECKOUTS_KEPT = 20
+
+
+def cart_conflict() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Cart changed concurrently, please retry"
+    )
+
+
+def cart_total(items: List[Dict[str, Any]]) -> float:
+    return round(sum(line["price"] * line["quantity"] for line in items), 2)
+
+
+def _line_with_quantity(quantity: Any) -> Dict[str, Any]:
+    """Update pipeline expression copying $$line with a new quantity"""
+    line = {field: f"$$line.{field}" for field in CartItem.model_fields}
+    line["quantity"] = quantity
+    return line
+
+
+def _total_stage() -> Dict[str, Any]:
+    """Update pipeline stage recomputing total from the lines, rounded to cents"""
+    subtotals = {"$map": {
+        "input": "$items",
+        "as": "line",
+        "in": {"$multiply": ["$$line.price", "$$line.quantity"]}
+    }}
+    return {"$set": {"total": {"$let": {
+        "vars": {"subtotals": subtotals},
+        "in": {"$divide": [{"$floor": {"$add": [{"$multiply": [{"$sum": "$$subtotals"}, 100]}, 0.5]}}, 100]}
+    }}}}
+
+
+class MongoCartStore:
+    """Carts stored in MongoDB, mutated with atomic in-place updates"""
+
+    async def get(self, db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+        return await db.carts.find_one({"user_id": user_id})
+
+    async def add_item(self, db: AsyncIOMotorDatabase, user_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.add_items(db, user_id, [item])
+
+    async def add_items(self, db: AsyncIOMotorDatabase, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add several lines (one per sweet) in a single atomic update.
+
+        Sweets already in the cart keep their snapshot price and gain the
+        quantity; the rest are appended. The pipeline upserts the cart, so a
+        retry is only needed when a concurrent upsert wins the user_id index.
+        """
+        added = {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$$line.sweet_id", {"$literal": item["sweet_id"]}]}, "then": item["quantity"]}
+                for item in items
+            ],
+            "default": 0
+        }}
+        for _ in range(CART_UPDATE_RETRIES):
+            now = datetime.utcnow()
+            pipeline = [
+                {"$set": {
+                    "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+                    "items": {"$ifNull": ["$items", []]},
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now
+                }},
+                {"$set": {"items": {"$concatArrays": [
+                    {"$map": {
+                        "input": "$items",
+                        "as": "line",
+                        "in": _line_with_quantity({"$add": ["$$line.quantity", added]})
+                    }},
+                    {"$filter": {
+                        "input": {"$literal": items},
+                        "as": "item",
+                        "cond": {"$not": {"$in": ["$$item.sweet_id", "$items.sweet_id"]}}
+                    }}
+                ]}}},
+                _total_stage()
+            ]
+            try:
+                return await db.carts.find_one_and_update(
+                    {"user_id": user_id},
+                    pipeline,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # The cart was created concurrently; the retry updates it
+                continue
+
+        raise cart_conflict()
+
+    async def set_quantity(self, db: AsyncIOMotorDatabase, user_id: str, sweet_id: str, quantity: int) -> Optional[Dict[str, Any]]:
+        """Set a line's quantity, removing it when quantity <= 0; None if the line is missing"""
+        if quantity <= 0:
+            return await self.remove_item(db, user_id, sweet_id)
+
+        return await db.carts.find_one_and_update(
+            {"user_id": user_id, "items.sweet_id": sweet_id},
+            [
+                {"$set": {
+                    "items": {"$map": {
+                        "input": "$items",
+                        "as": "line",
+                        "in": {"$cond": [
+                            {"$eq": ["$$line.sweet_id", {"$literal": sweet_id}]},
+                            _line_with_quantity(quantity),
+                            "$$line"
+                        ]}
+                    }},
+                    "updated_at": datetime.utcnow()
+                }},
+                _total_stage()
+            ],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def remove_item(self, db: AsyncIOMotorDatabase, user_id: str, sweet_id: str) -> Optional[Dict[str, Any]]:
+        return await db.carts.find_one_and_update(
+            {"user_id": user_id, "items.sweet_id": sweet_id},
+            [
+                {"$set": {
+                    "items": {"$filter": {
+                        "input": "$items",
+                        "as": "line",
+                        "cond": {"$ne": ["$$line.sweet_id", {"$literal": sweet_id}]}
+                    }},
+                    "updated_at": datetime.utcnow()
+                }},
+                _total_stage()
+            ],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def clear(self, db: AsyncIOMotorDatabase, user_id: str) -> None:
+        await db.carts.update_one(
+            {"user_id": user_id},
+            {"$set": {"items": [], "total": 0, "updated_at": datetime.utcnow()}}
+        )
+
+    async def remove_ordered(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        quantities: Dict[str, int],
+        order_id: str
+    ) -> None:
+        """Take an order's quantities (sweet_id -> quantity) out of the cart, once.
+
+        Anything added after checkout read the cart stays: lines that have
+        grown since keep the difference, and other lines are untouched.
+        """
+        for _ in range(CART_UPDATE_RETRIES):
+            cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0, "items": 1, "checked_out": 1})
+            if cart is None or order_id in cart.get("checked_out", []):
+                return
+            items = []
+            for line in cart["items"]:
+                quantity = quantities.get(line["sweet_id"], 0)
+                if line["quantity"] > quantity:
+                    items.append({**line, "quantity": line["quantity"] - quantity})
+
+            # Applied only if the cart is unchanged since the read; the order id
+            # is recorded in the same write so a repeat is skipped
+            result = await db.carts.update_one(
+                {"user_id": user_id, "items": cart["items"], "checked_out": {"$ne": order_id}},
+                {
+                    "$set": {"items": items, "total": cart_total(items), "updated_at": datetime.utcnow()},
+                    "$push": {"checked_out": {"$each": [order_id], "$slice": -CART_CHECKOUTS_KEPT}}
+                }
+            )
+            if result.matched_count:
+                return
+
+        raise cart_conflict()
+
+    async def flush_user(self, db: AsyncIOMotorDatabase, user_id: str) -> None:
+        """Carts are always in MongoDB already"""
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        pass
+
+    async def stop(self, db: AsyncIOMotorDatabase) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "mongo"}
+
+
+class MemoryCartBackend:
+    """Process-local key-value store for carts.
+
+    Any object with the same async get/set/delete methods, such as a thin
+    wrapper around a Redis client, can be passed to WriteBehindCartStore.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._data.get(key)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._data[key] = value
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WriteBehindCartStore:
+    """Carts kept in a key-value backend and flushed to MongoDB in batches.
+
+    Mutations only touch the backend and mark the cart dirty; a background
+    task writes dirty carts with one bulk_write per batch every
+    CART_FLUSH_INTERVAL_SECONDS, and once more at shutdown. Anything that
+    reads carts from MongoDB directly must call flush_user() first.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[Any] = None,
+        flush_interval: float = CART_FLUSH_INTERVAL_SECONDS,
+        batch_size: int = CART_FLUSH_BATCH_SIZE,
+        idle_seconds: float = CART_IDLE_SECONDS
+    ):
+        self.backend = backend if backend is not None else MemoryCartBackend()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self._dirty: set = set()
+        self._last_access: Dict[str, float] = {}
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.mutations = 0
+        self.flushes = 0
+        self.flushed_carts = 0
+        self.flush_errors = 0
+
+    def _user_lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user_id] = lock
+        return lock
+
+    async def _load(self, db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+        self._last_access[user_id] = time.monotonic()
+        cart = await self.backend.get(user_id)
+        if cart is None:
+            cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0})
+            if cart is not None:
+                await self.backend.set(user_id, cart)
+        return cart
+
+    async def _mutate(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        apply: Callable[[Dict[str, Any]], bool],
+        create: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        # apply() edits a private copy and returns False when there is nothing to change
+        async with self._user_lock(user_id):
+            cart = await self._load(db, user_id)
+            if cart is None:
+                if not create:
+                    return None
+                now = datetime.utcnow()
+                cart = {"id": str(uuid.uuid4()), "user_id": user_id, "items": [], "total": 0, "created_at": now}
+            else:
+                cart = copy.deepcopy(cart)
+            if not apply(cart):
+                return None
+
+            cart["total"] = cart_total(cart["items"])
+            cart["updated_at"] = datetime.utcnow()
+            await self.backend.set(user_id, cart)
+            self._dirty.add(user_id)
+            self.mutations += 1
+            return cart
+
+    async def get(self, db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._load(db, user_id)
+
+    async def add_item(self, db: AsyncIOMotorDatabase, user_id: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.add_items(db, user_id, [item])
+
+    async def add_items(self, db: AsyncIOMotorDatabase, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        def apply(cart: Dict[str, Any]) -> bool:
+            lines = {line["sweet_id"]: line for line in cart["items"]}
+            for item in items:
+                line = lines.get(item["sweet_id"])
+                if line is None:
+                    line = dict(item)
+                    cart["items"].append(line)
+                    lines[item["sweet_id"]] = line
+                else:
+                    line["quantity"] += item["quantity"]
+            return True
+        return await self._mutate(db, user_id, apply, create=True)
+
+    async def set_quantity(self, db: AsyncIOMotorDatabase, user_id: str, sweet_id: str, quantity: int) -> Optional[Dict[str, Any]]:
+        """Set a line's quantity, removing it when quantity <= 0; None if the line is missing"""
+        if quantity <= 0:
+            return await self.remove_item(db, user_id, sweet_id)
+
+        def apply(cart: Dict[str, Any]) -> bool:
+            for line in cart["items"]:
+                if line["sweet_id"] == sweet_id:
+                    line["quantity"] = quantity
+                    return True
+            return False
+        return await self._mutate(db, user_id, apply)
+
+    async def remove_item(self, db: AsyncIOMotorDatabase, user_id: str, sweet_id: str) -> Optional[Dict[str, Any]]:
+        def apply(cart: Dict[str, Any]) -> bool:
+            items = [line for line in cart["items"] if line["sweet_id"] != sweet_id]
+            if len(items) == len(cart["items"]):
+                return False
+            cart["items"] = items
+            return True
+        return await self._mutate(db, user_id, apply)
+
+    async def clear(self, db: AsyncIOMotorDatabase, user_id: str) -> None:
+        def apply(cart: Dict[str, Any]) -> bool:
+            cart["items"] = []
+            return True
+        await self._mutate(db, user_id, apply)
+
+    async def remove_ordered(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        quantities: Dict[str, int],
+        order_id: str
+    ) -> None:
+        """Take an order's quantities out of the cart, once"""
+        def apply(cart: Dict[str, Any]) -> bool:
+            checked_out = cart.get("checked_out", [])
+            if order_id in checked_out:
+                return False
+            items = []
+            for line in cart["items"]:
+                quantity = quantities.get(line["sweet_id"], 0)
+                if line["quantity"] > quantity:
+                    line["quantity"] -= quantity
+                    items.append(line)
+            cart["items"] = items
+            cart["checked_out"] = (checked_out + [order_id])[-CART_CHECKOUTS_KEPT:]
+            return True
+        await self._mutate(db, user_id, apply)
+
+    async def flush(self, db: AsyncIOMotorDatabase, user_ids: Optional[Iterable[str]] = None) -> int:
+        """Write dirty carts (all, or only user_ids) to MongoDB; returns how many were written"""
+        # Serialized so a caller never returns while another flush of its cart is mid-write
+        async with self._flush_lock:
+            pending = list(self._dirty if user_ids is None else self._dirty.intersection(user_ids))
+            written = 0
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                # Cleared first so a mutation during the write marks the cart dirty again
+                self._dirty.difference_update(batch)
+                requests = []
+                for user_id in batch:
+                    cart = await self.backend.get(user_id)
+                    if cart is not None:
+                        requests.append(ReplaceOne({"user_id": user_id}, cart, upsert=True))
+                if not requests:
+                    continue
+                completed = False
+                try:
+                    await db.carts.bulk_write(requests, ordered=False)
+                    completed = True
+                except Exception:
+                    self.flush_errors += 1
+                    raise
+                finally:
+                    # Also on cancellation at shutdown, so stop() writes them again
+                    if not completed:
+                        self._dirty.update(batch)
+                written += len(requests)
+            if written:
+                self.flushes += 1
+                self.flushed_carts += written
+            return written
+
+    async def flush_user(self, db: AsyncIOMotorDatabase, user_id: str) -> None:
+        await self.flush(db, [user_id])
+
+    async def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        for user_id, last_access in list(self._last_access.items()):
+            if last_access < cutoff and user_id not in self._dirty:
+                del self._last_access[user_id]
+                await self.backend.delete(user_id)
+
+    async def _flush_forever(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(db)
+                await self._evict_idle()
+            except Exception:
+                logger.exception("Flushing carts failed")
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        self._task = asyncio.create_task(self._flush_forever(db))
+
+    async def stop(self, db: AsyncIOMotorDatabase) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush(db)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "write-behind",
+            "cached": len(self._last_access),
+            "dirty": len(self._dirty),
+            "mutations": self.mutations,
+            "flushes": self.flushes,
+            "flushed_carts": self.flushed_carts,
+            "flush_errors": self.flush_errors,
+        }
+
+
+if CART_STORE == "write-behind":
+    cart_store = WriteBehindCartStore()
+elif CART_STORE == "mongo":
+    cart_store = MongoCartStore()
+else:
+    raise ValueError(f"CART_STORE must be 'mongo' or 'write-behind', not {CART_STORE!r}")
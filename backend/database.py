@@ -1,7 +1,107 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
 from models import Sweet, Category, User, UserRole
 from datetime import datetime
+from typing import Any, Dict, List
 import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes applied at startup; get_sweets sorts on (field, id) so each sort has a match
+INDEXES: Dict[str, List[IndexModel]] = {
+    "sweets": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("price", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("rating", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("category", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("category", ASCENDING), ("price", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("featured", ASCENDING)]),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("name", ASCENDING)], unique=True),
+    ],
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "wishlists": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "idempotency_keys": [
+        IndexModel([("key", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "outbox": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("claim", ASCENDING)], sparse=True),
+        # Processed events are kept for a week
+        IndexModel(
+            [("processed_at", ASCENDING)],
+            expireAfterSeconds=7 * 24 * 3600,
+            partialFilterExpression={"status": "done"}
+        ),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+}
+
+# Indexes that writes rely on for correctness; startup fails without them
+REQUIRED_INDEXES = {
+    ("carts", "user_id_1"),
+    ("revoked_tokens", "jti_1"),
+    ("idempotency_keys", "key_1"),
+}
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create registry indexes; existing identical indexes are left alone"""
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as exc:
+                # Conflicting options or duplicate keys in existing data
+                logger.error(f"Could not create index {index.document['name']} on {collection}: {exc}")
+                if (collection, index.document["name"]) in REQUIRED_INDEXES:
+                    raise
+
+async def get_index_report(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Usage stats for every index, plus registry indexes that are missing"""
+    report = {}
+    for collection, indexes in INDEXES.items():
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        present = {stat["name"] for stat in stats}
+        report[collection] = {
+            "indexes": [
+                {
+                    "name": stat["name"],
+                    "key": stat["key"],
+                    "ops": stat["accesses"]["ops"],
+                    "since": stat["accesses"]["since"],
+                    "registered": stat["name"] == "_id_" or any(index.document["name"] == stat["name"] for index in indexes),
+                }
+                for stat in sorted(stats, key=lambda stat: stat["name"])
+            ],
+            "missing": [index.document["name"] for index in indexes if index.document["name"] not in present],
+        }
+    return report
 
 async def init_database(db: AsyncIOMotorDatabase):
     """Initialize database with sample data"""
@@ -257,11 +357,22 @@ async def init_database(db: AsyncIOMotorDatabase):
     print("Database initialized successfully with sample data")
 
 async def get_category_counts(db: AsyncIOMotorDatabase):
-    """Update category counts based on current sweets"""
-    categories = await db.categories.find().to_list(100)
-    for category in categories:
-        count = await db.sweets.count_documents({"category": category["name"]})
-        await db.categories.update_one(
-            {"id": category["id"]},
-            {"$set": {"count": count}}
-        )
\ No newline at end of file
+    """Recount every category from the sweets collection.
+
+    Counts are normally kept current by adjust_category_count; this full
+    recount is the repair job for drift and for bulk imports.
+    """
+    counts = {}
+    async for entry in db.sweets.aggregate([{"$group": {"_id": "$category", "count": {"$sum": 1}}}]):
+        counts[entry["_id"]] = entry["count"]
+    
+    categories = await db.categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+    if categories:
+        await db.categories.bulk_write([
+            UpdateOne({"id": category["id"]}, {"$set": {"count": counts.get(category["name"], 0)}})
+            for category in categories
+        ], ordered=False)
+
+async def adjust_category_count(db: AsyncIOMotorDatabase, category: str, delta: int):
+    """Apply a sweet being added to (+1) or removed from (-1) a category"""
+    await db.categories.update_one({"name": category}, {"$inc": {"count": delta}})
\ No newline at end of file
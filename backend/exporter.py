@@ -0,0 +1,75 @@
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCursor
+from typing import Any, AsyncIterator, List
+from datetime import datetime
+from importer import CSV_LIST_SEPARATOR
+import csv
+import io
+import json
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Rows buffered per chunk written to the response
+EXPORT_FLUSH_ROWS = int(os.getenv("EXPORT_FLUSH_ROWS", "500"))
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return CSV_LIST_SEPARATOR.join(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+async def iter_export(cursor: AsyncIOMotorCursor, format: str, columns: List[str]) -> AsyncIterator[str]:
+    """Serialize documents from a cursor in bounded chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(columns)
+
+    rows = 0
+    async for doc in cursor:
+        if format == "csv":
+            writer.writerow([_csv_cell(doc.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps(doc, default=_json_default))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(cursor: AsyncIOMotorCursor, format: str, columns: List[str], name: str) -> StreamingResponse:
+    if format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format must be ndjson or csv"
+        )
+    filename = f"{name}-{datetime.utcnow():%Y%m%d%H%M%S}.{format}"
+    return StreamingResponse(
+        iter_export(cursor.batch_size(EXPORT_BATCH_SIZE), format, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,49 @@
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Any, Dict, Optional
+import hashlib
+import os
+
+# Cache-Control per route; "no-cache" lets clients store responses but revalidate with ETags
+CACHE_CONTROL = {
+    "sweets": os.getenv("CACHE_CONTROL_SWEETS", "public, no-cache"),
+    "sweet": os.getenv("CACHE_CONTROL_SWEET", "public, no-cache"),
+    "categories": os.getenv("CACHE_CONTROL_CATEGORIES", "public, no-cache"),
+}
+
+
+def render_json(content: Any) -> bytes:
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+
+def make_etag(body: bytes, *extra: Optional[str]) -> str:
+    """Strong ETag over the response body and any headers that vary with it"""
+    digest = hashlib.sha256(body)
+    for value in extra:
+        digest.update(b"\0" + (value or "").encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
+
+
+def conditional_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    route: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Return 304 when the client already holds this representation"""
+    response_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[route], **(headers or {})}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=body, media_type="application/json", headers=response_headers)
@@ -0,0 +1,177 @@
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from datetime import datetime, timedelta
+from cache import TTLCache
+from singleflight import SingleFlight
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+# How long a key is remembered; expired records are removed by the TTL index
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# A pending attempt older than this is presumed dead and may be taken over
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+# How long a duplicate waits for the first attempt before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_CACHE_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_CACHE_TTL_SECONDS", "600"))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(payload: Any) -> str:
+    """Hash of the request body, so a key reused for a different request is caught"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Run a request at most once per Idempotency-Key.
+
+    Keys are claimed with a pending record in the idempotency_keys
+    collection; the successful response is stored on it and replayed to
+    retries. Completed responses are also kept in memory so replays usually
+    skip MongoDB. Concurrent duplicates in this process share the first
+    attempt; duplicates in other processes poll its record. Failed attempts
+    release the key so the client can retry.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.responses = TTLCache(IDEMPOTENCY_CACHE_MAX_ENTRIES, IDEMPOTENCY_CACHE_TTL_SECONDS)
+        self.attempts = SingleFlight()
+        self.executions = 0
+        self.replays = 0
+        self.conflicts = 0
+
+    async def run(
+        self,
+        db: AsyncIOMotorDatabase,
+        scope: str,
+        key: str,
+        request_fingerprint: str,
+        fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """Return (response, replayed); replayed responses are JSON-ready dicts"""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+            )
+        record_key = f"{scope}:{key}"
+
+        cached = self.responses.get(record_key)
+        if cached is not None:
+            return self._replay(cached, request_fingerprint)
+
+        # Keyed by fingerprint too, so a mismatched duplicate doesn't share the result
+        return await self.attempts.do(
+            (record_key, request_fingerprint),
+            lambda: self._execute(db, record_key, request_fingerprint, fn)
+        )
+
+    def _key_reused(self) -> HTTPException:
+        self.conflicts += 1
+        return HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+
+    def _replay(self, stored: Tuple[str, Any], request_fingerprint: str) -> Tuple[Any, bool]:
+        stored_fingerprint, response = stored
+        if stored_fingerprint != request_fingerprint:
+            raise self._key_reused()
+        self.replays += 1
+        return response, True
+
+    async def _claim(self, db: AsyncIOMotorDatabase, record_key: str, request_fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            await db.idempotency_keys.insert_one({
+                "key": record_key,
+                "fingerprint": request_fingerprint,
+                "status": "pending",
+                "locked_until": now + timedelta(seconds=self.lock_seconds),
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            })
+            return True
+        except DuplicateKeyError:
+            pass
+
+        # Take over an attempt whose process died before finishing
+        result = await db.idempotency_keys.update_one(
+            {
+                "key": record_key,
+                "fingerprint": request_fingerprint,
+                "status": "pending",
+                "locked_until": {"$lt": now},
+            },
+            {"$set": {"locked_until": now + timedelta(seconds=self.lock_seconds)}}
+        )
+        return result.modified_count == 1
+
+    async def _execute(
+        self,
+        db: AsyncIOMotorDatabase,
+        record_key: str,
+        request_fingerprint: str,
+        fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        deadline = time.monotonic() + self.wait_seconds
+        while not await self._claim(db, record_key, request_fingerprint):
+            record = await db.idempotency_keys.find_one({"key": record_key})
+            if record is not None:
+                if record["status"] == "done":
+                    stored = (record["fingerprint"], record["response"])
+                    self.responses.set(record_key, stored, self.responses.version)
+                    return self._replay(stored, request_fingerprint)
+                if record["fingerprint"] != request_fingerprint:
+                    raise self._key_reused()
+            # else released by a failed attempt; poll and try to claim it again
+            if time.monotonic() > deadline:
+                self.conflicts += 1
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+        self.executions += 1
+        try:
+            response = await fn()
+        except BaseException:
+            await db.idempotency_keys.delete_one({"key": record_key, "status": "pending"})
+            raise
+
+        stored_response = jsonable_encoder(response)
+        await db.idempotency_keys.update_one(
+            {"key": record_key},
+            {"$set": {"status": "done", "response": stored_response}, "$unset": {"locked_until": ""}}
+        )
+        self.responses.set(record_key, (request_fingerprint, stored_response), self.responses.version)
+        return response, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executions": self.executions,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "cache": self.responses.stats(),
+            "in_flight": self.attempts.stats()["in_flight"],
+        }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,91 @@
+from fastapi import Request
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+import csv
+import json
+
+# CSV cells holding lists use this separator, e.g. "Sugar;Milk;Cardamom"
+CSV_LIST_SEPARATOR = ";"
+CSV_LIST_FIELDS = {"ingredients"}
+
+# A parsed record is either the row data or an error message for that row
+Record = Tuple[int, Union[Dict[str, Any], str]]
+
+
+def detect_format(request: Request, format: Optional[str]) -> str:
+    if format:
+        return format.lower()
+    content_type = request.headers.get("content-type", "")
+    return "csv" if "csv" in content_type else "ndjson"
+
+
+def format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+async def iter_lines(request: Request) -> AsyncIterator[str]:
+    """Yield decoded lines from the request body as it streams in"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig") + "\n"
+    if buffer:
+        yield buffer.decode("utf-8-sig")
+
+
+async def iter_ndjson(request: Request) -> AsyncIterator[Record]:
+    row = 0
+    async for line in iter_lines(request):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield row, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield row, "Row must be a JSON object"
+            continue
+        yield row, data
+
+
+async def iter_csv(request: Request) -> AsyncIterator[Record]:
+    header: Optional[List[str]] = None
+    row = 0
+    pending = ""
+    async for line in iter_lines(request):
+        # Quoted cells may span lines; wait until the quotes balance
+        pending += line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        data = {}
+        for name, value in zip(header, values):
+            value = value.strip()
+            if value == "":
+                continue
+            if name in CSV_LIST_FIELDS:
+                data[name] = [part.strip() for part in value.split(CSV_LIST_SEPARATOR) if part.strip()]
+            else:
+                data[name] = value
+        yield row, data
+
+
+def iter_records(request: Request, format: str) -> AsyncIterator[Record]:
+    return iter_csv(request) if format == "csv" else iter_ndjson(request)
@@ -0,0 +1,99 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from typing import Any, Dict, List, Optional
+from cache import catalog_cache
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# "auto" uses transactions when connected to a replica set or sharded cluster
+ORDER_TRANSACTIONS = os.getenv("ORDER_TRANSACTIONS", "auto").lower()
+
+_transactions_supported: Optional[bool] = None
+
+
+async def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    global _transactions_supported
+    if ORDER_TRANSACTIONS in ("0", "false", "no", "off"):
+        return False
+    if _transactions_supported is None:
+        try:
+            hello = await db.client.admin.command("hello")
+            _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            logger.warning("Could not detect transaction support; using compensating writes")
+            _transactions_supported = False
+    return _transactions_supported
+
+
+def merge_quantities(items: List[Dict[str, Any]]) -> Dict[str, int]:
+    quantities: Dict[str, int] = {}
+    for item in items:
+        quantities[item["sweet_id"]] = quantities.get(item["sweet_id"], 0) + item["quantity"]
+    return quantities
+
+
+async def release_stock(db: AsyncIOMotorDatabase, items: List[Dict[str, Any]], session=None) -> None:
+    """Give stock back for order lines with one bulk_write"""
+    quantities = merge_quantities(items)
+    if not quantities:
+        return
+    await db.sweets.bulk_write(
+        [UpdateOne({"id": sweet_id}, {"$inc": {"stock": quantity}}) for sweet_id, quantity in quantities.items()],
+        ordered=False,
+        session=session
+    )
+
+
+async def reserve_stock(db: AsyncIOMotorDatabase, items: List[Dict[str, Any]], session=None) -> None:
+    """Take stock for every order line in one bulk_write, all or nothing.
+
+    Each line is a $inc guarded by stock >= quantity. If fewer lines match
+    than were sent, the reservation fails. With a session, aborting the
+    transaction undoes the lines that matched; without one, each line is
+    tagged with a hold id so exactly those lines can be given back.
+    """
+    names = {item["sweet_id"]: item["name"] for item in items}
+    lines = list(merge_quantities(items).items())
+    hold = None if session is not None else str(uuid.uuid4())
+
+    def take(quantity: int) -> Dict[str, Any]:
+        update: Dict[str, Any] = {"$inc": {"stock": -quantity}}
+        if hold:
+            update["$push"] = {"holds": hold}
+        return update
+
+    result = await db.sweets.bulk_write(
+        [UpdateOne({"id": sweet_id, "stock": {"$gte": quantity}}, take(quantity)) for sweet_id, quantity in lines],
+        ordered=False,
+        session=session
+    )
+    if result.matched_count == len(lines):
+        if hold:
+            await db.sweets.update_many(
+                {"id": {"$in": [sweet_id for sweet_id, _ in lines]}, "holds": hold},
+                {"$pull": {"holds": hold}}
+            )
+        return
+
+    if hold:
+        await db.sweets.bulk_write([
+            UpdateOne({"id": sweet_id, "holds": hold}, {"$inc": {"stock": quantity}, "$pull": {"holds": hold}})
+            for sweet_id, quantity in lines
+        ], ordered=False)
+        # Readers may have cached the briefly lowered stock
+        catalog_cache.invalidate()
+
+    # Committed stock doesn't include this attempt, so it shows which line fell short
+    stock = {
+        sweet["id"]: sweet["stock"]
+        async for sweet in db.sweets.find({"id": {"$in": [sweet_id for sweet_id, _ in lines]}}, {"_id": 0, "id": 1, "stock": 1})
+    }
+    failed = next((sweet_id for sweet_id, quantity in lines if stock.get(sweet_id, 0) < quantity), lines[0][0])
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Not enough stock for {names[failed]}"
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -77,6 +77,39 @@ class Sweet(SweetBase):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class SweetSummary(BaseModel):
+    id: str
+    name: str
+    price: float
+    image: str
+    rating: float = 4.5
+    stock: int = 0
+
+class SweetBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+    fields: Optional[str] = None
+
+class SweetBatchItem(BaseModel):
+    id: str
+    found: bool
+    sweet: Optional[Dict[str, Any]] = None
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: float
+    max: Optional[float] = None
+    count: int
+
+class SweetFacets(BaseModel):
+    items: List[Sweet]
+    total: int
+    categories: List[FacetCount]
+    price_buckets: List[PriceBucket]
+    featured: int
+
 # Category Models
 class CategoryBase(BaseModel):
     name: str
@@ -105,6 +138,15 @@ class Cart(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class PricedCartItem(CartItem):
+    added_price: float
+    price_changed: bool = False
+    available: bool = True
+
+class PricedCart(Cart):
+    items: List[PricedCartItem] = []
+    has_changes: bool = False
+
 class CartAddRequest(BaseModel):
     sweet_id: str
     quantity: int = 1
@@ -112,6 +154,19 @@ class CartAddRequest(BaseModel):
 class CartUpdateRequest(BaseModel):
     quantity: int
 
+class CartAddManyRequest(BaseModel):
+    items: List[CartAddRequest] = Field(..., min_length=1, max_length=100)
+
+class CartAddFailure(BaseModel):
+    sweet_id: str
+    quantity: int
+    error: str
+
+class CartAddManyResponse(BaseModel):
+    cart: Cart
+    added: List[str] = []
+    failed: List[CartAddFailure] = []
+
 # Wishlist Models
 class WishlistItem(BaseModel):
     sweet_id: str
@@ -136,6 +191,17 @@ class OrderStatus(str, Enum):
     DELIVERED = "delivered"
     CANCELLED = "cancelled"
 
+# Allowed next statuses; delivered and cancelled are final
+ORDER_STATUS_TRANSITIONS: Dict[OrderStatus, Set[OrderStatus]] = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.PREPARING, OrderStatus.CANCELLED},
+    OrderStatus.PREPARING: {OrderStatus.READY, OrderStatus.CANCELLED},
+    OrderStatus.READY: {OrderStatus.DELIVERED, OrderStatus.CANCELLED},
+    OrderStatus.DELIVERED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+ORDER_STATUS_VALUES = {order_status.value for order_status in OrderStatus}
+
 class OrderItem(BaseModel):
     sweet_id: str
     name: str
@@ -155,6 +221,28 @@ class Order(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class OrderSummary(BaseModel):
+    id: str
+    status: OrderStatus
+    total: float
+    item_count: int
+    created_at: datetime
+
+class OrderStatusChange(BaseModel):
+    order_id: str
+    status: OrderStatus
+
+class OrderStatusBulkRequest(BaseModel):
+    changes: List[OrderStatusChange] = Field(..., min_length=1, max_length=500)
+
+class OrderStatusFailure(BaseModel):
+    order_id: str
+    error: str
+
+class OrderStatusBulkResponse(BaseModel):
+    updated: List[str] = []
+    failed: List[OrderStatusFailure] = []
+
 class OrderCreate(BaseModel):
     address: str
     phone: str
@@ -181,11 +269,27 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class MessageResponse(BaseModel):
     message: str
     success: bool = True
 
+class BulkImportError(BaseModel):
+    row: int
+    id: Optional[str] = None
+    error: str
+
+class BulkImportResponse(BaseModel):
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[BulkImportError] = []
+
 class AdminStatsResponse(BaseModel):
     total_sweets: int
     low_stock_count: int
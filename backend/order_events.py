@@ -0,0 +1,42 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, Dict, List
+from cache import catalog_cache
+from pricing import price_table
+from cart_store import cart_store
+from inventory import supports_transactions, merge_quantities, release_stock
+from outbox import OutboxWorker
+
+
+async def remove_ordered_lines(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]):
+    # The cart remembers which orders it gave up lines to, so redelivery is a no-op
+    for event in events:
+        placed = event["payload"]
+        await cart_store.remove_ordered(db, placed["user_id"], placed["quantities"], placed["order_id"])
+
+
+async def restore_cancelled_stock(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]):
+    # Orders restored by an earlier, interrupted attempt are skipped
+    orders = await db.orders.find(
+        {"id": {"$in": [event["payload"]["order_id"] for event in events]}, "stock_restored": {"$ne": True}},
+        {"_id": 0, "id": 1, "items": 1}
+    ).to_list(None)
+    if not orders:
+        return
+
+    items = [item for order in orders for item in order["items"]]
+    restored = ({"id": {"$in": [order["id"] for order in orders]}}, {"$set": {"stock_restored": True}})
+    if await supports_transactions(db):
+        async with await db.client.start_session() as session:
+            async with session.start_transaction():
+                await release_stock(db, items, session=session)
+                await db.orders.update_many(*restored, session=session)
+    else:
+        await release_stock(db, items)
+        await db.orders.update_many(*restored)
+    price_table.adjust_stock(merge_quantities(items))
+    catalog_cache.invalidate()
+
+
+def register_order_handlers(worker: OutboxWorker) -> None:
+    worker.handler("order.placed")(remove_ordered_lines)
+    worker.handler("order.cancelled")(restore_cancelled_stock)
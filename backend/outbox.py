@@ -0,0 +1,188 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "1"))
+# A claimed batch not finished within this time is picked up again
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+BatchHandler = Callable[[AsyncIOMotorDatabase, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class OutboxWorker:
+    """Applies side effects recorded in the outbox collection.
+
+    Events are written with enqueue(), in the same transaction as the change
+    that caused them when one is in use. A background task claims due events
+    in batches, hands each event type's batch to its handler, and retries
+    failed batches with exponential backoff. Delivery is at least once, so
+    handlers must be safe to repeat.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._handlers: Dict[str, BatchHandler] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_lag_seconds = 0.0
+
+    def handler(self, event_type: str) -> Callable[[BatchHandler], BatchHandler]:
+        def register(fn: BatchHandler) -> BatchHandler:
+            self._handlers[event_type] = fn
+            return fn
+        return register
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, event_type: str, payload: Dict[str, Any], session=None) -> None:
+        await self.enqueue_many(db, event_type, [payload], session=session)
+
+    async def enqueue_many(
+        self,
+        db: AsyncIOMotorDatabase,
+        event_type: str,
+        payloads: List[Dict[str, Any]],
+        session=None
+    ) -> None:
+        now = datetime.utcnow()
+        await db.outbox.insert_many([
+            {
+                "id": str(uuid.uuid4()),
+                "type": event_type,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "available_at": now,
+                "created_at": now,
+            }
+            for payload in payloads
+        ], session=session)
+
+    def notify(self) -> None:
+        """Wake the worker now instead of at the next poll"""
+        self._wake.set()
+
+    async def _claim(self, db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        due = {"$or": [
+            {"status": "pending", "available_at": {"$lte": now}},
+            {"status": "processing", "lease_until": {"$lt": now}},
+        ]}
+        candidates = await db.outbox.find(due, {"_id": 0, "id": 1}).sort("available_at", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+
+        # Another worker may claim some of the same events; each keeps only its own
+        claim = str(uuid.uuid4())
+        await db.outbox.update_many(
+            {"$and": [{"id": {"$in": [event["id"] for event in candidates]}}, due]},
+            {"$set": {"status": "processing", "claim": claim, "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+        )
+        return await db.outbox.find({"claim": claim, "status": "processing"}, {"_id": 0}).to_list(None)
+
+    async def process_batch(self, db: AsyncIOMotorDatabase) -> int:
+        """Claim and apply one batch of due events; returns how many were claimed"""
+        events = await self._claim(db)
+        if not events:
+            return 0
+
+        now = datetime.utcnow()
+        self.last_lag_seconds = max((now - event["created_at"]).total_seconds() for event in events)
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            by_type.setdefault(event["type"], []).append(event)
+
+        updates = []
+        for event_type, batch in by_type.items():
+            try:
+                handler = self._handlers.get(event_type)
+                if handler is None:
+                    raise RuntimeError(f"No outbox handler for {event_type}")
+                await handler(db, batch)
+            except Exception as exc:
+                logger.exception(f"Outbox handler for {event_type} failed on {len(batch)} events")
+                for event in batch:
+                    updates.append(self._retry_update(event, exc, now))
+                continue
+            self.processed += len(batch)
+            updates.extend(
+                UpdateOne(
+                    {"id": event["id"]},
+                    {"$set": {"status": "done", "processed_at": now}, "$unset": {"claim": "", "lease_until": ""}}
+                )
+                for event in batch
+            )
+
+        await db.outbox.bulk_write(updates, ordered=False)
+        self.batches += 1
+        return len(events)
+
+    def _retry_update(self, event: Dict[str, Any], exc: Exception, now: datetime) -> UpdateOne:
+        attempts = event["attempts"] + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            # Left in the collection for inspection; it is never retried
+            self.failed += 1
+            fields = {"status": "failed", "processed_at": now}
+        else:
+            self.retried += 1
+            delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            fields = {"status": "pending", "available_at": now + timedelta(seconds=delay)}
+        return UpdateOne(
+            {"id": event["id"]},
+            {"$set": {**fields, "attempts": attempts, "last_error": str(exc)}, "$unset": {"claim": "", "lease_until": ""}}
+        )
+
+    async def _run_forever(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            try:
+                # Keep draining while full batches come back
+                while await self.process_batch(db) >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Processing outbox failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        self._task = asyncio.create_task(self._run_forever(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def stats(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        queued = {"status": {"$in": ["pending", "processing"]}}
+        oldest = await db.outbox.find_one(queued, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+        return {
+            "depth": await db.outbox.count_documents(queued),
+            "failed_events": await db.outbox.count_documents({"status": "failed"}),
+            "oldest_lag_seconds": (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0,
+            "last_batch_lag_seconds": self.last_lag_seconds,
+            "batches": self.batches,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+outbox = OutboxWorker()
@@ -0,0 +1,62 @@
+from fastapi import HTTPException, status
+from typing import Any, Dict, Optional
+from datetime import datetime
+import base64
+import binascii
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _load_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort_field: str, sort_direction: int, value: Any, last_id: str) -> str:
+    """Encode the last seen (sort value, id) pair as an opaque cursor"""
+    payload = {"f": sort_field, "d": sort_direction, "v": _dump_value(value), "id": last_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str, sort_direction: int) -> Dict[str, Any]:
+    """Decode a cursor, checking it was issued for the same sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value = _load_value(payload["v"])
+        last_id = payload["id"]
+        valid = payload["f"] == sort_field and payload["d"] == sort_direction
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        valid = False
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor for this sort order"
+        )
+    return {"value": value, "id": last_id}
+
+
+def keyset_filter(sort_field: str, sort_direction: int, value: Any, last_id: str) -> Dict[str, Any]:
+    """Mongo filter seeking past (value, last_id) in a (sort_field, id) ordering"""
+    op = "$gt" if sort_direction == 1 else "$lt"
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "id": {op: last_id}}
+    ]}
+
+
+def next_cursor(items: list, limit: int, sort_field: str, sort_direction: int) -> Optional[str]:
+    """Cursor for the page after items, which were fetched with limit + 1"""
+    if len(items) <= limit:
+        return None
+    last = items[limit - 1]
+    return encode_cursor(sort_field, sort_direction, last.get(sort_field), last["id"])
@@ -0,0 +1,139 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+# Full reload interval; bounds staleness for catalog writes made by other processes
+PRICE_TABLE_TTL_SECONDS = float(os.getenv("PRICE_TABLE_TTL_SECONDS", "30"))
+
+
+class PriceTable:
+    """In-memory sweet_id -> (price, stock) table for the whole catalog.
+
+    Price and stock writes made by this process are applied to single
+    entries as they happen; the whole catalog is only reloaded when the
+    TTL runs out (or after expire()), which also picks up writes made by
+    other processes. Repricing a cart never needs a query per line.
+    """
+
+    def __init__(self, ttl_seconds: float = PRICE_TABLE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        # Writes made while a reload is running, replayed onto its result
+        self._missed: Optional[List[Tuple[Callable[..., None], Any]]] = None
+        self.loads = 0
+        self.updates = 0
+        self.repriced_carts = 0
+        self.changed_lines = 0
+
+    def _is_fresh(self) -> bool:
+        return self._expires_at > time.monotonic()
+
+    async def refresh(self, db: AsyncIOMotorDatabase) -> None:
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            entries: Dict[str, Tuple[float, int]] = {}
+            self._missed = []
+            try:
+                async for sweet in db.sweets.find({}, {"_id": 0, "id": 1, "price": 1, "stock": 1}):
+                    entries[sweet["id"]] = (sweet["price"], sweet["stock"])
+                for apply, arg in self._missed:
+                    apply(entries, arg)
+            finally:
+                self._missed = None
+            self._entries = entries
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            self.version += 1
+            self.loads += 1
+
+    def expire(self) -> None:
+        """Reload the whole table on the next refresh, e.g. after a bulk import"""
+        self._expires_at = 0.0
+
+    def _record(self, apply: Callable[..., None], arg: Any) -> None:
+        apply(self._entries, arg)
+        if self._missed is not None:
+            self._missed.append((apply, arg))
+        self.updates += 1
+
+    @staticmethod
+    def _set(entries: Dict[str, Tuple[float, int]], sweet: Dict[str, Any]) -> None:
+        entries[sweet["id"]] = (sweet["price"], sweet["stock"])
+
+    @staticmethod
+    def _discard(entries: Dict[str, Tuple[float, int]], sweet_id: str) -> None:
+        entries.pop(sweet_id, None)
+
+    @staticmethod
+    def _adjust(entries: Dict[str, Tuple[float, int]], deltas: Dict[str, int]) -> None:
+        for sweet_id, delta in deltas.items():
+            entry = entries.get(sweet_id)
+            if entry is not None:
+                entries[sweet_id] = (entry[0], entry[1] + delta)
+
+    def update(self, sweet: Dict[str, Any]) -> None:
+        """Apply a sweet that was created or had its price or stock written"""
+        self._record(self._set, sweet)
+
+    def discard(self, sweet_id: str) -> None:
+        self._record(self._discard, sweet_id)
+
+    def adjust_stock(self, deltas: Dict[str, int]) -> None:
+        """Apply committed stock changes, as sweet_id -> quantity added"""
+        self._record(self._adjust, deltas)
+
+    def __contains__(self, sweet_id: str) -> bool:
+        return sweet_id in self._entries
+
+    def reprice(self, cart: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of the cart at current prices, flagging changed lines.
+
+        Lines keep the price they were added at as added_price. Lines whose
+        sweet is gone or short on stock are marked unavailable; sweets that
+        no longer exist are left out of the total.
+        """
+        items: List[Dict[str, Any]] = []
+        total = 0.0
+        has_changes = False
+        for item in cart.get("items", []):
+            entry = self._entries.get(item["sweet_id"])
+            if entry is None:
+                price, available = item["price"], False
+            else:
+                price, stock = entry
+                available = stock >= item["quantity"]
+                total += price * item["quantity"]
+            price_changed = price != item["price"]
+            if price_changed or not available:
+                has_changes = True
+                self.changed_lines += 1
+            items.append({
+                **item,
+                "price": price,
+                "added_price": item["price"],
+                "price_changed": price_changed,
+                "available": available,
+            })
+        self.repriced_carts += 1
+        return {**cart, "items": items, "total": total, "has_changes": has_changes}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "size": len(self._entries),
+            "fresh": self._is_fresh(),
+            "loads": self.loads,
+            "updates": self.updates,
+            "repriced_carts": self.repriced_carts,
+            "changed_lines": self.changed_lines,
+        }
+
+
+price_table = PriceTable()
@@ -0,0 +1,40 @@
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from typing import Dict, Iterable, Optional, Type
+
+
+def build_projection(
+    fields: Optional[str],
+    model: Type[BaseModel],
+    presets: Optional[Dict[str, Iterable[str]]] = None,
+    always: Iterable[str] = ("id",)
+) -> Optional[Dict[str, int]]:
+    """Turn a comma-separated fields parameter into a Mongo projection.
+
+    Returns None when no fields were requested, meaning full documents.
+    A preset name (e.g. "summary") expands to its field list.
+    """
+    if not fields:
+        return None
+
+    requested = []
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if presets and name in presets:
+            requested.extend(presets[name])
+        else:
+            requested.append(name)
+
+    unknown = sorted(set(requested) - set(model.model_fields))
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+
+    projection = {"_id": 0}
+    for name in [*always, *requested]:
+        projection[name] = 1
+    return projection
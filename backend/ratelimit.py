@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from jose import JWTError, jwt
+from auth import SECRET_KEY, ALGORITHM
+import json
+import math
+import os
+import time
+
+# "METHOD /path" -> per-scope limits; scopes are "ip" and "user"
+DEFAULT_RATE_LIMITS = {
+    "POST /api/auth/login": {"ip": {"per_minute": 20, "burst": 10}},
+    "POST /api/auth/register": {"ip": {"per_minute": 10, "burst": 5}},
+    "POST /api/auth/social-login": {"ip": {"per_minute": 20, "burst": 10}},
+    "POST /api/auth/refresh": {"ip": {"per_minute": 30, "burst": 10}},
+    "POST /api/orders": {
+        "user": {"per_minute": 10, "burst": 5},
+        "ip": {"per_minute": 60, "burst": 20},
+    },
+}
+# JSON in the same shape as DEFAULT_RATE_LIMITS replaces the defaults
+RATE_LIMITS = json.loads(os.getenv("RATE_LIMITS", "null")) or DEFAULT_RATE_LIMITS
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Refill, then return seconds until a token is available (0 if one is)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Dict[str, Dict[str, float]]] = RATE_LIMITS, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.limits = {route.rstrip("/"): scopes for route, scopes in limits.items()}
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str, str], TokenBucket]" = OrderedDict()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def _bucket(self, key: Tuple[str, str, str], limit: Dict[str, float], now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(limit["per_minute"] / 60.0, limit["burst"], now)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, route: str, clients: Dict[str, Optional[str]]) -> float:
+        """Admit the request (0.0) or return the Retry-After delay in seconds.
+
+        A token is taken from every bucket only when all of them admit, so a
+        rejection by one scope doesn't drain the others.
+        """
+        scopes = self.limits.get(route)
+        if not scopes:
+            return 0.0
+
+        now = time.monotonic()
+        buckets: List[TokenBucket] = []
+        wait = 0.0
+        for scope, limit in scopes.items():
+            client = clients.get(scope)
+            if client is None:
+                continue
+            bucket = self._bucket((route, scope, client), limit, now)
+            wait = max(wait, bucket.wait_time(now))
+            buckets.append(bucket)
+
+        if wait > 0:
+            self.rejected[route] = self.rejected.get(route, 0) + 1
+            return wait
+        for bucket in buckets:
+            bucket.tokens -= 1
+        self.admitted += 1
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "rejected_total": sum(self.rejected.values()),
+            "buckets": len(self._buckets),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_ip(scope: Dict[str, Any]) -> Optional[str]:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+def _user_id(scope: Dict[str, Any]) -> Optional[str]:
+    # Signature is verified so a forged token can't drain another user's bucket
+    authorization = _header(scope, b"authorization")
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
+class RateLimitMiddleware:
+    """ASGI middleware that sheds load with a fast 429 before any work is done"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = f"{scope['method']} {scope['path'].rstrip('/')}"
+        if route not in self.limiter.limits:
+            await self.app(scope, receive, send)
+            return
+
+        scopes = self.limiter.limits[route]
+        clients = {
+            "ip": _client_ip(scope) if "ip" in scopes else None,
+            "user": _user_id(scope) if "user" in scopes else None,
+        }
+        wait = self.limiter.check(route, clients)
+        if wait <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,9 +1,33 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import User, AdminStatsResponse, MessageResponse
+from pymongo import UpdateOne
+from models import (
+    User, Order, Sweet, AdminStatsResponse, MessageResponse, OrderStatus, ORDER_STATUS_TRANSITIONS, ORDER_STATUS_VALUES,
+    OrderStatusBulkRequest, OrderStatusFailure, OrderStatusBulkResponse
+)
 from auth import create_admin_dependency
+from projection import build_projection
+from exporter import export_response
+from database import get_index_report
+from inventory import supports_transactions
+from outbox import outbox
+from order_events import restore_cancelled_stock
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+def created_at_filter(created_from: Optional[datetime], created_to: Optional[datetime]) -> Dict[str, Any]:
+    query = {}
+    if created_from is not None or created_to is not None:
+        date_query = {}
+        if created_from is not None:
+            date_query["$gte"] = created_from
+        if created_to is not None:
+            date_query["$lte"] = created_to
+        query["created_at"] = date_query
+    return query
 
 def create_admin_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/admin", tags=["admin"])
@@ -41,38 +65,165 @@ def create_admin_router(db: AsyncIOMotorDatabase):
         )
     
     @router.get("/users")
-    async def get_users(current_user: User = Depends(get_admin_user)):
-        users = await db.users.find(
-            {},
-            {"password": 0}  # Exclude password from response
-        ).to_list(100)
+    async def get_users(
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        # Password is never part of User, so a projection can't include it
+        projection = build_projection(fields, User) or {"_id": 0, "password": 0}
+        users = await db.users.find({}, projection).to_list(100)
         return users
     
     @router.get("/orders")
-    async def get_all_orders(current_user: User = Depends(get_admin_user)):
-        orders = await db.orders.find().sort("created_at", -1).to_list(100)
+    async def get_all_orders(
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        projection = build_projection(fields, Order) or {"_id": 0}
+        orders = await db.orders.find({}, projection).sort("created_at", -1).to_list(100)
         return orders
     
+    @router.get("/indexes")
+    async def get_index_stats(current_user: User = Depends(get_admin_user)):
+        # Indexes with zero ops are candidates for removal, "missing" ones need creating
+        return await get_index_report(db)
+    
+    @router.get("/export/sweets")
+    async def export_sweets(
+        format: str = Query("ndjson", description="Export format: ndjson, csv"),
+        category: Optional[str] = Query(None, description="Filter by category"),
+        created_from: Optional[datetime] = Query(None, description="Created at or after"),
+        created_to: Optional[datetime] = Query(None, description="Created at or before"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        query = created_at_filter(created_from, created_to)
+        if category:
+            query["category"] = category
+        # holds are transient checkout bookkeeping, not catalog data
+        cursor = db.sweets.find(query, {"_id": 0, "holds": 0})
+        return export_response(cursor, format, list(Sweet.model_fields), "sweets")
+    
+    @router.get("/export/orders")
+    async def export_orders(
+        format: str = Query("ndjson", description="Export format: ndjson, csv"),
+        order_status: Optional[str] = Query(None, alias="status", description="Filter by order status"),
+        created_from: Optional[datetime] = Query(None, description="Created at or after"),
+        created_to: Optional[datetime] = Query(None, description="Created at or before"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        query = created_at_filter(created_from, created_to)
+        if order_status:
+            query["status"] = order_status
+        cursor = db.orders.find(query, {"_id": 0})
+        return export_response(cursor, format, list(Order.model_fields), "orders")
+    
+    @router.get("/export/users")
+    async def export_users(
+        format: str = Query("ndjson", description="Export format: ndjson, csv"),
+        created_from: Optional[datetime] = Query(None, description="Created at or after"),
+        created_to: Optional[datetime] = Query(None, description="Created at or before"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        query = created_at_filter(created_from, created_to)
+        cursor = db.users.find(query, {"_id": 0, "password": 0})
+        return export_response(cursor, format, list(User.model_fields), "users")
+    
+    async def change_order_statuses(changes: Dict[str, OrderStatus]) -> OrderStatusBulkResponse:
+        """Apply status changes allowed by ORDER_STATUS_TRANSITIONS in one bulk_write"""
+        report = OrderStatusBulkResponse()
+        current = {
+            order["id"]: order["status"]
+            async for order in db.orders.find({"id": {"$in": list(changes)}}, {"_id": 0, "id": 1, "status": 1})
+        }
+        
+        now = datetime.utcnow()
+        planned: List[str] = []
+        requests = []
+        for order_id, new_status in changes.items():
+            stored_status = current.get(order_id)
+            if stored_status is None:
+                error = "Order not found"
+            elif stored_status not in ORDER_STATUS_VALUES:
+                # Free-form statuses from before the lifecycle was enforced
+                error = f"Order has unknown status {stored_status}"
+            elif new_status not in ORDER_STATUS_TRANSITIONS[OrderStatus(stored_status)]:
+                error = f"Cannot change status from {OrderStatus(stored_status).value} to {new_status.value}"
+            else:
+                # Conditional on the status read above, so a concurrent change can't skip a step
+                planned.append(order_id)
+                requests.append(UpdateOne(
+                    {"id": order_id, "status": OrderStatus(stored_status).value},
+                    {"$set": {"status": new_status.value, "updated_at": now}}
+                ))
+                continue
+            report.failed.append(OrderStatusFailure(order_id=order_id, error=error))
+        if not requests:
+            return report
+        
+        async def apply(session=None) -> List[str]:
+            result = await db.orders.bulk_write(requests, ordered=False, session=session)
+            applied = planned
+            if result.modified_count < len(requests):
+                latest = {
+                    order["id"]: order["status"]
+                    async for order in db.orders.find({"id": {"$in": planned}}, {"_id": 0, "id": 1, "status": 1}, session=session)
+                }
+                applied = [order_id for order_id in planned if latest.get(order_id) == changes[order_id].value]
+            
+            # Stock for all cancelled orders is restored by the outbox worker in one batched write
+            events = [{"order_id": order_id} for order_id in applied if changes[order_id] == OrderStatus.CANCELLED]
+            if not events:
+                return applied
+            try:
+                await outbox.enqueue_many(db, "order.cancelled", events, session=session)
+            except Exception:
+                if session is not None:
+                    raise
+                # The cancellations stand, so restore their stock here instead
+                logger.exception(f"Could not enqueue order.cancelled for {len(events)} orders")
+                await restore_cancelled_stock(db, [{"payload": event} for event in events])
+            return applied
+        
+        if await supports_transactions(db):
+            async with await db.client.start_session() as session:
+                async with session.start_transaction():
+                    applied = await apply(session)
+        else:
+            applied = await apply()
+        outbox.notify()
+        
+        report.updated = applied
+        for order_id in planned:
+            if order_id not in applied:
+                report.failed.append(OrderStatusFailure(order_id=order_id, error="Order status changed concurrently"))
+        return report
+    
     @router.patch("/order/{order_id}/status")
     async def update_order_status(
         order_id: str,
-        status: str,
+        new_status: OrderStatus = Query(..., alias="status"),
         current_user: User = Depends(get_admin_user)
     ):
         # Update order status
-        result = await db.orders.update_one(
-            {"id": order_id},
-            {"$set": {"status": status, "updated_at": datetime.utcnow()}}
-        )
-        
-        if result.matched_count == 0:
+        report = await change_order_statuses({order_id: new_status})
+        if report.failed:
+            error = report.failed[0].error
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Order not found"
+                status_code=status.HTTP_404_NOT_FOUND if error == "Order not found" else status.HTTP_400_BAD_REQUEST,
+                detail=error
             )
         
         return MessageResponse(message="Order status updated successfully")
     
+    @router.post("/orders/status", response_model=OrderStatusBulkResponse)
+    async def update_order_statuses(
+        request: OrderStatusBulkRequest,
+        current_user: User = Depends(get_admin_user)
+    ):
+        # Last change wins when an order is listed twice
+        changes = {change.order_id: change.status for change in request.changes}
+        return await change_order_statuses(changes)
+    
     @router.get("/dashboard-data")
     async def get_dashboard_data(current_user: User = Depends(get_admin_user)):
         # Get comprehensive dashboard data
@@ -93,11 +244,13 @@ def create_admin_router(db: AsyncIOMotorDatabase):
         category_distribution = await db.sweets.aggregate(category_pipeline).to_list(10)
         
         # Order statistics
+        status_counts = {
+            row["_id"]: row["count"]
+            for row in await db.orders.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(None)
+        }
         order_stats = {
-            "total": await db.orders.count_documents({}),
-            "pending": await db.orders.count_documents({"status": "pending"}),
-            "completed": await db.orders.count_documents({"status": "completed"}),
-            "cancelled": await db.orders.count_documents({"status": "cancelled"})
+            "total": sum(status_counts.values()),
+            **{order_status.value: status_counts.get(order_status.value, 0) for order_status in OrderStatus}
         }
         
         # Revenue data
@@ -122,7 +275,7 @@ def create_admin_router(db: AsyncIOMotorDatabase):
         top_sweets = await db.orders.aggregate(top_sweets_pipeline).to_list(5)
         
         # Recent activity
-        recent_orders = await db.orders.find().sort("created_at", -1).limit(10).to_list(10)
+        recent_orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
         
         return {
             "sweet_stats": sweet_stats,
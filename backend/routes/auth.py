@@ -1,16 +1,36 @@
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, Dict, Optional
 from models import (
     User, UserCreate, UserLogin, UserResponse, TokenResponse, 
-    SocialLoginData, MessageResponse, UserRole
+    SocialLoginData, MessageResponse, UserRole, RefreshRequest
 )
 from auth import (
-    verify_password, get_password_hash, create_access_token,
-    create_user_dependency
+    password_hasher, create_access_token, create_refresh_token, user_claims,
+    create_user_dependency, invalidate_user, verify_token, revocation_list
 )
-from datetime import timedelta, datetime
+from datetime import datetime
 import uuid
 
+optional_security = HTTPBearer(auto_error=False)
+
+def token_response(user_doc: Dict[str, Any]) -> TokenResponse:
+    # The access token carries the user's role and profile as signed claims
+    return TokenResponse(
+        access_token=create_access_token(data=user_claims(user_doc)),
+        refresh_token=create_refresh_token(user_doc["id"]),
+        token_type="bearer",
+        user=UserResponse(
+            id=user_doc["id"],
+            name=user_doc["name"],
+            email=user_doc["email"],
+            role=user_doc["role"],
+            avatar=user_doc.get("avatar"),
+            provider=user_doc.get("provider")
+        )
+    )
+
 def create_auth_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/auth", tags=["authentication"])
     get_current_user = create_user_dependency(db)
@@ -37,28 +57,12 @@ def create_auth_router(db: AsyncIOMotorDatabase):
         
         # Hash password and store user
         user_dict = user.dict()
-        user_dict["password"] = get_password_hash(user_data.password)
+        user_dict["password"] = await password_hasher.hash(user_data.password)
         
         await db.users.insert_one(user_dict)
         
-        # Create access token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user.id}, expires_delta=access_token_expires
-        )
-        
-        return TokenResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user=UserResponse(
-                id=user.id,
-                name=user.name,
-                email=user.email,
-                role=user.role,
-                avatar=user.avatar,
-                provider=user.provider
-            )
-        )
+        # Create tokens
+        return token_response(user_dict)
     
     @router.post("/login", response_model=TokenResponse)
     async def login(user_data: UserLogin):
@@ -71,30 +75,14 @@ def create_auth_router(db: AsyncIOMotorDatabase):
             )
         
         # Verify password
-        if not verify_password(user_data.password, user_doc["password"]):
+        if not await password_hasher.verify(user_data.password, user_doc["password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
         
-        # Create access token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user_doc["id"]}, expires_delta=access_token_expires
-        )
-        
-        return TokenResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user=UserResponse(
-                id=user_doc["id"],
-                name=user_doc["name"],
-                email=user_doc["email"],
-                role=user_doc["role"],
-                avatar=user_doc.get("avatar"),
-                provider=user_doc.get("provider")
-            )
-        )
+        # Create tokens
+        return token_response(user_doc)
     
     @router.post("/social-login", response_model=TokenResponse)
     async def social_login(social_data: SocialLoginData):
@@ -111,6 +99,7 @@ def create_auth_router(db: AsyncIOMotorDatabase):
                     "updated_at": datetime.utcnow()
                 }}
             )
+            invalidate_user(existing_user["id"])
             user_id = existing_user["id"]
         else:
             # Create new user
@@ -132,24 +121,28 @@ def create_auth_router(db: AsyncIOMotorDatabase):
         # Get updated user
         user_doc = await db.users.find_one({"id": user_id})
         
-        # Create access token
-        access_token_expires = timedelta(minutes=30)
-        access_token = create_access_token(
-            data={"sub": user_id}, expires_delta=access_token_expires
-        )
+        # Create tokens
+        return token_response(user_doc)
+    
+    @router.post("/refresh", response_model=TokenResponse)
+    async def refresh(request: RefreshRequest):
+        payload = verify_token(request.refresh_token, "refresh")
+        
+        # Reload the user so role and profile changes reach the new claims
+        user_doc = await db.users.find_one({"id": payload["sub"]})
+        if not user_doc:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
         
-        return TokenResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user=UserResponse(
-                id=user_doc["id"],
-                name=user_doc["name"],
-                email=user_doc["email"],
-                role=user_doc["role"],
-                avatar=user_doc.get("avatar"),
-                provider=user_doc.get("provider")
+        # Refresh tokens are single use; the revoke upsert decides who used it first
+        if not await revocation_list.revoke(db, payload):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token has already been used"
             )
-        )
+        return token_response(user_doc)
     
     @router.get("/me", response_model=UserResponse)
     async def get_current_user_info(current_user: User = Depends(get_current_user)):
@@ -163,7 +156,21 @@ def create_auth_router(db: AsyncIOMotorDatabase):
         )
     
     @router.post("/logout", response_model=MessageResponse)
-    async def logout():
+    async def logout(
+        request: Optional[RefreshRequest] = None,
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+    ):
+        # Revoke whichever tokens the client presents; invalid ones need no revoking
+        presented = []
+        if credentials:
+            presented.append((credentials.credentials, "access"))
+        if request:
+            presented.append((request.refresh_token, "refresh"))
+        for token, token_type in presented:
+            try:
+                await revocation_list.revoke(db, verify_token(token, token_type))
+            except HTTPException:
+                pass
         return MessageResponse(message="Logged out successfully")
     
     return router
\ No newline at end of file
@@ -1,24 +1,29 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
-from models import Cart, CartItem, CartAddRequest, CartUpdateRequest, User, MessageResponse
+from typing import Any, Dict, List
+from models import (
+    Cart, CartItem, CartAddRequest, CartUpdateRequest, User, MessageResponse,
+    CartAddManyRequest, CartAddFailure, CartAddManyResponse, PricedCart
+)
 from auth import create_user_dependency
-from datetime import datetime
+from singleflight import find_sweet
+from pricing import price_table
+from cart_store import cart_store
 
 def create_cart_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/cart", tags=["cart"])
     get_current_user = create_user_dependency(db)
     
-    @router.get("/", response_model=Cart)
+    @router.get("/", response_model=PricedCart)
     async def get_cart(current_user: User = Depends(get_current_user)):
-        cart = await db.carts.find_one({"user_id": current_user.id})
+        cart = await cart_store.get(db, current_user.id)
         if not cart:
-            # Create empty cart
-            cart = Cart(user_id=current_user.id)
-            await db.carts.insert_one(cart.dict())
-        else:
-            cart = Cart(**cart)
-        return cart
+            # Empty carts are created on the first add, not on read
+            return PricedCart(user_id=current_user.id)
+        
+        # Show current prices; the stored lines keep the price they were added at
+        await price_table.refresh(db)
+        return PricedCart(**price_table.reprice(cart))
     
     @router.post("/add", response_model=Cart)
     async def add_to_cart(
@@ -26,7 +31,7 @@ def create_cart_router(db: AsyncIOMotorDatabase):
         current_user: User = Depends(get_current_user)
     ):
         # Find the sweet
-        sweet = await db.sweets.find_one({"id": request.sweet_id})
+        sweet = await find_sweet(db, request.sweet_id)
         if not sweet:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -40,14 +45,6 @@ def create_cart_router(db: AsyncIOMotorDatabase):
                 detail="Not enough stock available"
             )
         
-        # Find or create cart
-        cart = await db.carts.find_one({"user_id": current_user.id})
-        if not cart:
-            cart = Cart(user_id=current_user.id)
-            cart_dict = cart.dict()
-        else:
-            cart_dict = cart
-        
         # Create cart item
         cart_item = CartItem(
             sweet_id=request.sweet_id,
@@ -58,35 +55,62 @@ def create_cart_router(db: AsyncIOMotorDatabase):
             weight=sweet["weight"]
         )
         
-        # Check if item already exists in cart
-        existing_item_index = None
-        for i, item in enumerate(cart_dict.get("items", [])):
-            if item["sweet_id"] == request.sweet_id:
-                existing_item_index = i
-                break
-        
-        if existing_item_index is not None:
-            # Update quantity
-            cart_dict["items"][existing_item_index]["quantity"] += request.quantity
-        else:
-            # Add new item
-            if "items" not in cart_dict:
-                cart_dict["items"] = []
-            cart_dict["items"].append(cart_item.dict())
-        
-        # Calculate total
-        total = sum(item["price"] * item["quantity"] for item in cart_dict["items"])
-        cart_dict["total"] = total
-        cart_dict["updated_at"] = datetime.utcnow()
-        
-        # Save cart
-        await db.carts.replace_one(
-            {"user_id": current_user.id},
-            cart_dict,
-            upsert=True
-        )
+        cart = await cart_store.add_item(db, current_user.id, cart_item.dict())
+        return Cart(**cart)
+    
+    @router.post("/add-many", response_model=CartAddManyResponse)
+    async def add_many_to_cart(
+        request: CartAddManyRequest,
+        current_user: User = Depends(get_current_user)
+    ):
+        # Merge repeated sweets so each line is touched once
+        quantities: Dict[str, int] = {}
+        for item in request.items:
+            quantities[item.sweet_id] = quantities.get(item.sweet_id, 0) + item.quantity
+        
+        # Validate every sweet with one query
+        sweets: Dict[str, Dict[str, Any]] = {}
+        async for sweet in db.sweets.find(
+            {"id": {"$in": list(quantities)}},
+            {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1, "image": 1, "weight": 1}
+        ):
+            sweets[sweet["id"]] = sweet
+        
+        accepted: Dict[str, int] = {}
+        failed: List[CartAddFailure] = []
+        for sweet_id, quantity in quantities.items():
+            sweet = sweets.get(sweet_id)
+            if quantity <= 0:
+                error = "Quantity must be positive"
+            elif not sweet:
+                error = "Sweet not found"
+            elif sweet["stock"] < quantity:
+                error = "Not enough stock available"
+            else:
+                accepted[sweet_id] = quantity
+                continue
+            failed.append(CartAddFailure(sweet_id=sweet_id, quantity=quantity, error=error))
+        
+        if not accepted:
+            cart = await cart_store.get(db, current_user.id)
+            return CartAddManyResponse(
+                cart=Cart(**cart) if cart else Cart(user_id=current_user.id),
+                failed=failed
+            )
         
-        return Cart(**cart_dict)
+        items = []
+        for sweet_id, quantity in accepted.items():
+            sweet = sweets[sweet_id]
+            items.append(CartItem(
+                sweet_id=sweet_id,
+                quantity=quantity,
+                price=sweet["price"],
+                name=sweet["name"],
+                image=sweet["image"],
+                weight=sweet["weight"]
+            ).dict())
+        cart = await cart_store.add_items(db, current_user.id, items)
+        return CartAddManyResponse(cart=Cart(**cart), added=list(accepted), failed=failed)
     
     @router.put("/item/{sweet_id}", response_model=Cart)
     async def update_cart_item(
@@ -94,52 +118,27 @@ def create_cart_router(db: AsyncIOMotorDatabase):
         request: CartUpdateRequest,
         current_user: User = Depends(get_current_user)
     ):
-        # Find cart
-        cart = await db.carts.find_one({"user_id": current_user.id})
-        if not cart:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Cart not found"
-            )
-        
-        # Find item in cart
-        item_index = None
-        for i, item in enumerate(cart["items"]):
-            if item["sweet_id"] == sweet_id:
-                item_index = i
-                break
-        
-        if item_index is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Item not found in cart"
-            )
-        
-        # Update quantity or remove item
-        if request.quantity <= 0:
-            cart["items"].pop(item_index)
-        else:
-            # Check stock
-            sweet = await db.sweets.find_one({"id": sweet_id})
+        # Check stock
+        if request.quantity > 0:
+            sweet = await find_sweet(db, sweet_id)
             if sweet and sweet["stock"] < request.quantity:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Not enough stock available"
                 )
-            
-            cart["items"][item_index]["quantity"] = request.quantity
-        
-        # Calculate total
-        total = sum(item["price"] * item["quantity"] for item in cart["items"])
-        cart["total"] = total
-        cart["updated_at"] = datetime.utcnow()
-        
-        # Save cart
-        await db.carts.replace_one(
-            {"user_id": current_user.id},
-            cart
-        )
         
+        # Update quantity or remove item
+        cart = await cart_store.set_quantity(db, current_user.id, sweet_id, request.quantity)
+        if cart is None:
+            if not await cart_store.get(db, current_user.id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Cart not found"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Item not found in cart"
+            )
         return Cart(**cart)
     
     @router.delete("/item/{sweet_id}", response_model=Cart)
@@ -147,36 +146,21 @@ def create_cart_router(db: AsyncIOMotorDatabase):
         sweet_id: str,
         current_user: User = Depends(get_current_user)
     ):
-        # Find cart
-        cart = await db.carts.find_one({"user_id": current_user.id})
-        if not cart:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Cart not found"
-            )
-        
-        # Remove item
-        cart["items"] = [item for item in cart["items"] if item["sweet_id"] != sweet_id]
-        
-        # Calculate total
-        total = sum(item["price"] * item["quantity"] for item in cart["items"])
-        cart["total"] = total
-        cart["updated_at"] = datetime.utcnow()
-        
-        # Save cart
-        await db.carts.replace_one(
-            {"user_id": current_user.id},
-            cart
-        )
-        
+        cart = await cart_store.remove_item(db, current_user.id, sweet_id)
+        if cart is None:
+            # Nothing to remove; return the cart as it is
+            existing_cart = await cart_store.get(db, current_user.id)
+            if not existing_cart:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Cart not found"
+                )
+            return Cart(**existing_cart)
         return Cart(**cart)
     
     @router.delete("/clear", response_model=MessageResponse)
     async def clear_cart(current_user: User = Depends(get_current_user)):
-        await db.carts.update_one(
-            {"user_id": current_user.id},
-            {"$set": {"items": [], "total": 0, "updated_at": datetime.utcnow()}}
-        )
+        await cart_store.clear(db, current_user.id)
         return MessageResponse(message="Cart cleared successfully")
     
     return router
\ No newline at end of file
@@ -1,26 +1,35 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
 from models import Category, User, MessageResponse
 from auth import create_admin_dependency
 from database import get_category_counts
+from http_cache import render_json, make_etag, conditional_response
+from cache import catalog_cache
 
 def create_categories_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/categories", tags=["categories"])
     get_admin_user = create_admin_dependency(db)
     
     @router.get("/", response_model=List[Category])
-    async def get_categories():
-        # Update counts first
-        await get_category_counts(db)
+    async def get_categories(request: Request):
+        # Counts are maintained by sweet writes, so this is a plain read
+        cached = catalog_cache.get(("categories",))
+        if cached is not None:
+            body, etag = cached
+            return conditional_response(request, body, etag, "categories")
+        version = catalog_cache.version
         
-        # Get categories
         categories = await db.categories.find().to_list(100)
-        return [Category(**category) for category in categories]
+        body = render_json([Category(**category) for category in categories])
+        etag = make_etag(body)
+        catalog_cache.set(("categories",), (body, etag), version)
+        return conditional_response(request, body, etag, "categories")
     
     @router.post("/refresh-counts", response_model=MessageResponse)
     async def refresh_category_counts(current_user: User = Depends(get_admin_user)):
         await get_category_counts(db)
+        catalog_cache.invalidate()
         return MessageResponse(message="Category counts refreshed successfully")
     
     return router
\ No newline at end of file
@@ -1,26 +1,88 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
-from models import Order, OrderCreate, OrderItem, User, MessageResponse
+from typing import List, Optional
+from models import (
+    Order, OrderCreate, OrderItem, OrderSummary, OrderStatus, ORDER_STATUS_TRANSITIONS, ORDER_STATUS_VALUES, User,
+    MessageResponse
+)
 from auth import create_user_dependency
+from cache import catalog_cache
+from pricing import price_table
+from cart_store import cart_store
+from inventory import supports_transactions, merge_quantities, reserve_stock, release_stock
+from order_events import remove_ordered_lines, restore_cancelled_stock
+from idempotency import idempotency_store, fingerprint
+from outbox import outbox
+from projection import build_projection
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, keyset_filter, next_cursor
 from datetime import datetime
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 def create_orders_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/orders", tags=["orders"])
     get_current_user = create_user_dependency(db)
     
-    @router.get("/", response_model=List[Order])
-    async def get_user_orders(current_user: User = Depends(get_current_user)):
-        orders = await db.orders.find({"user_id": current_user.id}).sort("created_at", -1).to_list(100)
-        return [Order(**order) for order in orders]
+    @router.get("/", response_model=List[OrderSummary])
+    async def get_user_orders(
+        limit: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+        fields: Optional[str] = Query(None, description="Comma-separated order fields to return instead of summaries"),
+        current_user: User = Depends(get_current_user)
+    ):
+        # Newest first; id breaks ties so pages never overlap
+        query = {"user_id": current_user.id}
+        if cursor:
+            after = decode_cursor(cursor, "created_at", -1)
+            query.update(keyset_filter("created_at", -1, after["value"], after["id"]))
+        
+        projection = build_projection(fields, Order, always=("id", "created_at"))
+        if projection is None:
+            # Summaries are computed in MongoDB so items never leave the server
+            projection = {
+                "_id": 0, "id": 1, "status": 1, "total": 1, "created_at": 1,
+                "item_count": {"$sum": "$items.quantity"}
+            }
+        orders = await db.orders.aggregate([
+            {"$match": query},
+            {"$sort": {"created_at": -1, "id": -1}},
+            {"$limit": limit + 1},
+            {"$project": projection},
+        ]).to_list(limit + 1)
+        
+        page_cursor = next_cursor(orders, limit, "created_at", -1)
+        headers = {NEXT_CURSOR_HEADER: page_cursor} if page_cursor else {}
+        # Documents come back in their final shape, so model construction is skipped
+        return JSONResponse(content=jsonable_encoder(orders[:limit]), headers=headers)
     
     @router.post("/", response_model=Order)
     async def create_order(
         order_data: OrderCreate,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
         current_user: User = Depends(get_current_user)
     ):
-        # Get user's cart
+        if idempotency_key is None:
+            return await place_order(order_data, current_user)
+        
+        # Retries with the same key get the first attempt's order back
+        order, replayed = await idempotency_store.run(
+            db,
+            f"orders:{current_user.id}",
+            idempotency_key,
+            fingerprint(order_data),
+            lambda: place_order(order_data, current_user)
+        )
+        if replayed:
+            return JSONResponse(content=order, headers={"Idempotent-Replayed": "true"})
+        return order
+    
+    async def place_order(order_data: OrderCreate, current_user: User) -> Order:
+        # Get user's cart, as flushed to MongoDB
+        await cart_store.flush_user(db, current_user.id)
         cart = await db.carts.find_one({"user_id": current_user.id})
         if not cart or not cart.get("items"):
             raise HTTPException(
@@ -28,24 +90,25 @@ def create_orders_router(db: AsyncIOMotorDatabase):
                 detail="Cart is empty"
             )
         
-        # Validate stock for all items
-        for cart_item in cart["items"]:
-            sweet = await db.sweets.find_one({"id": cart_item["sweet_id"]})
-            if not sweet:
+        # Reprice against the current catalog and validate stock for all items
+        await price_table.refresh(db)
+        priced_cart = price_table.reprice(cart)
+        for cart_item in priced_cart["items"]:
+            if cart_item["available"]:
+                continue
+            if cart_item["sweet_id"] not in price_table:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Sweet {cart_item['name']} not found"
                 )
-            
-            if sweet["stock"] < cart_item["quantity"]:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Not enough stock for {cart_item['name']}"
-                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Not enough stock for {cart_item['name']}"
+            )
         
         # Create order items
         order_items = []
-        for cart_item in cart["items"]:
+        for cart_item in priced_cart["items"]:
             order_item = OrderItem(
                 sweet_id=cart_item["sweet_id"],
                 name=cart_item["name"],
@@ -60,7 +123,7 @@ def create_orders_router(db: AsyncIOMotorDatabase):
             id=str(uuid.uuid4()),
             user_id=current_user.id,
             items=order_items,
-            total=cart["total"],
+            total=priced_cart["total"],
             address=order_data.address,
             phone=order_data.phone,
             notes=order_data.notes,
@@ -68,21 +131,39 @@ def create_orders_router(db: AsyncIOMotorDatabase):
             updated_at=datetime.utcnow()
         )
         
-        # Save order
-        await db.orders.insert_one(order.dict())
-        
-        # Update stock for all items
-        for cart_item in cart["items"]:
-            await db.sweets.update_one(
-                {"id": cart_item["sweet_id"]},
-                {"$inc": {"stock": -cart_item["quantity"]}}
-            )
+        # Reserve stock and save the order with its order.placed event, in one
+        # transaction when available
+        order_doc = order.dict()
+        quantities = merge_quantities(order_doc["items"])
+        placed = {"order_id": order.id, "user_id": current_user.id, "quantities": quantities}
+        if await supports_transactions(db):
+            async with await db.client.start_session() as session:
+                async with session.start_transaction():
+                    await reserve_stock(db, order_doc["items"], session=session)
+                    await db.orders.insert_one(order_doc, session=session)
+                    await outbox.enqueue(db, "order.placed", placed, session=session)
+        else:
+            await reserve_stock(db, order_doc["items"])
+            try:
+                await db.orders.insert_one(order_doc)
+            except Exception:
+                await release_stock(db, order_doc["items"])
+                catalog_cache.invalidate()
+                raise
+            try:
+                await outbox.enqueue(db, "order.placed", placed)
+            except Exception:
+                logger.exception(f"Could not enqueue order.placed for {order.id}")
         
-        # Clear cart
-        await db.carts.update_one(
-            {"user_id": current_user.id},
-            {"$set": {"items": [], "total": 0, "updated_at": datetime.utcnow()}}
-        )
+        # Take the ordered lines out of the cart now so the next checkout can't
+        # include them; the worker repeats this and skips it if already done
+        try:
+            await remove_ordered_lines(db, [{"payload": placed}])
+        except Exception:
+            logger.exception(f"Could not remove ordered lines from the cart for {order.id}")
+        price_table.adjust_stock({sweet_id: -quantity for sweet_id, quantity in quantities.items()})
+        catalog_cache.invalidate()
+        outbox.notify()
         
         return order
     
@@ -112,25 +193,45 @@ def create_orders_router(db: AsyncIOMotorDatabase):
                 detail="Order not found"
             )
         
-        # Check if order can be cancelled
-        if order["status"] in ["delivered", "cancelled"]:
+        # Check if order can be cancelled; free-form legacy statuses can't
+        if (
+            order["status"] not in ORDER_STATUS_VALUES
+            or OrderStatus.CANCELLED not in ORDER_STATUS_TRANSITIONS[OrderStatus(order["status"])]
+        ):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Order cannot be cancelled"
             )
         
-        # Update order status
-        await db.orders.update_one(
-            {"id": order_id},
-            {"$set": {"status": "cancelled", "updated_at": datetime.utcnow()}}
-        )
+        # Update order status; the worker restores stock
+        cancellable = {"id": order_id, "status": {"$in": [
+            current.value for current, allowed in ORDER_STATUS_TRANSITIONS.items() if OrderStatus.CANCELLED in allowed
+        ]}}
+        update = {"$set": {"status": "cancelled", "updated_at": datetime.utcnow()}}
+        cancelled = {"order_id": order_id}
+        if await supports_transactions(db):
+            async with await db.client.start_session() as session:
+                async with session.start_transaction():
+                    result = await db.orders.update_one(cancellable, update, session=session)
+                    if result.modified_count:
+                        await outbox.enqueue(db, "order.cancelled", cancelled, session=session)
+        else:
+            result = await db.orders.update_one(cancellable, update)
+            if result.modified_count:
+                try:
+                    await outbox.enqueue(db, "order.cancelled", cancelled)
+                except Exception:
+                    # The cancellation stands, so restore its stock here instead
+                    logger.exception(f"Could not enqueue order.cancelled for {order_id}")
+                    await restore_cancelled_stock(db, [{"payload": cancelled}])
         
-        # Restore stock
-        for item in order["items"]:
-            await db.sweets.update_one(
-                {"id": item["sweet_id"]},
-                {"$inc": {"stock": item["quantity"]}}
+        # Lost a race with another cancellation or a delivery
+        if not result.modified_count:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Order cannot be cancelled"
             )
+        outbox.notify()
         
         return MessageResponse(message="Order cancelled successfully")
     
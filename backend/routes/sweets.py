@@ -1,80 +1,325 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional
-from models import Sweet, SweetCreate, SweetUpdate, User, MessageResponse
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from typing import Any, Dict, List, Optional, Tuple
+from models import (
+    Sweet, SweetCreate, SweetUpdate, SweetSummary, User, MessageResponse,
+    BulkImportError, BulkImportResponse, SweetFacets, FacetCount, PriceBucket,
+    SweetBatchRequest, SweetBatchItem
+)
 from auth import create_user_dependency, create_admin_dependency
-from database import get_category_counts
+from database import get_category_counts, adjust_category_count
+from cache import catalog_cache
+from search import search_index
+from pricing import price_table
+from singleflight import find_sweet
+from pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor, keyset_filter, next_cursor
+from projection import build_projection
+from importer import detect_format, format_validation_error, iter_records
+from http_cache import render_json, make_etag, conditional_response
 from datetime import datetime
+import os
 import uuid
 
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "500"))
+
+def build_sweet_filters(
+    category: Optional[str],
+    featured: Optional[bool],
+    min_price: Optional[float],
+    max_price: Optional[float]
+) -> Dict[str, Dict[str, Any]]:
+    """Filter clauses keyed by dimension, so a facet can leave out its own"""
+    filters = {}
+    
+    if category:
+        filters["category"] = {"category": category}
+    
+    if featured is not None:
+        filters["featured"] = {"featured": featured}
+    
+    if min_price is not None or max_price is not None:
+        price_query = {}
+        if min_price is not None:
+            price_query["$gte"] = min_price
+        if max_price is not None:
+            price_query["$lte"] = max_price
+        filters["price"] = {"price": price_query}
+    
+    return filters
+
+def merge_filters(filters: Dict[str, Dict[str, Any]], exclude: Optional[str] = None) -> Dict[str, Any]:
+    query = {}
+    for name, clause in filters.items():
+        if name != exclude:
+            query.update(clause)
+    return query
+
+def resolve_sort(sort_by: Optional[str], sort_order: Optional[str], search: Optional[str]) -> Tuple[str, int]:
+    if sort_by is None:
+        sort_by = "relevance" if search else "name"
+    
+    if sort_by == "relevance" and search:
+        sort_field = "relevance"
+    elif sort_by == "price":
+        sort_field = "price"
+    elif sort_by == "rating":
+        sort_field = "rating"
+    elif sort_by == "created_at":
+        sort_field = "created_at"
+    else:
+        sort_field = "name"
+    
+    sort_direction = -1 if sort_order == "desc" else 1
+    return sort_field, sort_direction
+
 def create_sweets_router(db: AsyncIOMotorDatabase):
     router = APIRouter(prefix="/sweets", tags=["sweets"])
     get_current_user = create_user_dependency(db)
     get_admin_user = create_admin_dependency(db)
     
+    def page_headers(page_cursor: Optional[str]):
+        return {NEXT_CURSOR_HEADER: page_cursor} if page_cursor else {}
+    
     @router.get("/", response_model=List[Sweet])
     async def get_sweets(
+        request: Request,
         category: Optional[str] = Query(None, description="Filter by category"),
-        search: Optional[str] = Query(None, description="Search in name and description"),
+        search: Optional[str] = Query(None, description="Search in name, description, category and ingredients"),
         featured: Optional[bool] = Query(None, description="Filter by featured status"),
         min_price: Optional[float] = Query(None, description="Minimum price filter"),
         max_price: Optional[float] = Query(None, description="Maximum price filter"),
-        sort_by: Optional[str] = Query("name", description="Sort by: name, price, rating, created_at"),
+        sort_by: Optional[str] = Query(None, description="Sort by: relevance, name, price, rating, created_at (default: relevance when searching, otherwise name)"),
         sort_order: Optional[str] = Query("asc", description="Sort order: asc, desc"),
         skip: int = Query(0, ge=0, description="Skip items for pagination"),
-        limit: int = Query(100, ge=1, le=100, description="Limit items per page")
+        limit: int = Query(100, ge=1, le=500, description="Limit items per page"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return, or 'summary' for grid cards")
     ):
-        # Build query
-        query = {}
+        # Build query and sort
+        query = merge_filters(build_sweet_filters(category, featured, min_price, max_price))
+        sort_field, sort_direction = resolve_sort(sort_by, sort_order, search)
+        
+        # Build projection; id and the sort field are kept for cursors
+        projection = build_projection(fields, Sweet, {"summary": SweetSummary.model_fields})
+        if projection and sort_field != "relevance":
+            projection[sort_field] = 1
         
-        if category:
-            query["category"] = category
+        # Serve from cache when possible
+        cache_key = (
+            "list", category, search, featured,
+            None if min_price is None else float(min_price),
+            None if max_price is None else float(max_price),
+            sort_field, sort_direction, skip, limit, cursor,
+            tuple(projection) if projection else None
+        )
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            body, etag, page_cursor = cached
+            return conditional_response(request, body, etag, "sweets", page_headers(page_cursor))
+        version = catalog_cache.version
+        after = decode_cursor(cursor, sort_field, sort_direction) if cursor else None
         
+        # Resolve search terms through the inverted index
         if search:
-            query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]
+            await search_index.ensure_built(db)
+            scores = dict(search_index.search(search))
+            query["id"] = {"$in": list(scores)}
         
-        if featured is not None:
-            query["featured"] = featured
-        
-        if min_price is not None or max_price is not None:
-            price_query = {}
-            if min_price is not None:
-                price_query["$gte"] = min_price
-            if max_price is not None:
-                price_query["$lte"] = max_price
-            query["price"] = price_query
-        
-        # Build sort
-        sort_field = sort_by
-        if sort_by == "price":
-            sort_field = "price"
-        elif sort_by == "rating":
-            sort_field = "rating"
-        elif sort_by == "created_at":
-            sort_field = "created_at"
+        # Execute query, fetching one extra document to detect a next page
+        page_cursor = None
+        if search and not scores:
+            sweets = []
+        elif sort_field == "relevance":
+            # Rank in memory using the search index scores
+            def rank_key(sweet):
+                return (-scores[sweet["id"]], sweet["id"])
+            
+            sweets = await db.sweets.find(query, projection).to_list(length=len(scores))
+            sweets.sort(key=rank_key, reverse=sort_direction == -1)
+            if after:
+                last_key = (-after["value"], after["id"])
+                if sort_direction == 1:
+                    sweets = [sweet for sweet in sweets if rank_key(sweet) > last_key]
+                else:
+                    sweets = [sweet for sweet in sweets if rank_key(sweet) < last_key]
+            sweets = sweets[skip:skip + limit + 1]
+            if len(sweets) > limit:
+                last = sweets[limit - 1]
+                page_cursor = encode_cursor(sort_field, sort_direction, scores[last["id"]], last["id"])
         else:
-            sort_field = "name"
+            if after:
+                query = {"$and": [query, keyset_filter(sort_field, sort_direction, after["value"], after["id"])]}
+            db_cursor = (
+                db.sweets.find(query, projection)
+                .sort([(sort_field, sort_direction), ("id", sort_direction)])
+                .skip(skip)
+                .limit(limit + 1)
+            )
+            sweets = await db_cursor.to_list(length=limit + 1)
+            page_cursor = next_cursor(sweets, limit, sort_field, sort_direction)
         
-        sort_direction = -1 if sort_order == "desc" else 1
+        if projection:
+            # Partial documents skip model construction entirely
+            body = render_json(sweets[:limit])
+        else:
+            body = render_json([Sweet(**sweet) for sweet in sweets[:limit]])
+        etag = make_etag(body, page_cursor)
+        catalog_cache.set(cache_key, (body, etag, page_cursor), version)
+        return conditional_response(request, body, etag, "sweets", page_headers(page_cursor))
+    
+    @router.get("/facets", response_model=SweetFacets)
+    async def get_sweet_facets(
+        request: Request,
+        category: Optional[str] = Query(None, description="Filter by category"),
+        search: Optional[str] = Query(None, description="Search in name, description, category and ingredients"),
+        featured: Optional[bool] = Query(None, description="Filter by featured status"),
+        min_price: Optional[float] = Query(None, description="Minimum price filter"),
+        max_price: Optional[float] = Query(None, description="Maximum price filter"),
+        sort_by: Optional[str] = Query(None, description="Sort by: relevance, name, price, rating, created_at (default: relevance when searching, otherwise name)"),
+        sort_order: Optional[str] = Query("asc", description="Sort order: asc, desc"),
+        skip: int = Query(0, ge=0, description="Skip items for pagination"),
+        limit: int = Query(24, ge=1, le=100, description="Limit items per page"),
+        price_buckets: str = Query("0,10,25,50,100", description="Comma-separated price bucket lower bounds")
+    ):
+        filters = build_sweet_filters(category, featured, min_price, max_price)
+        sort_field, sort_direction = resolve_sort(sort_by, sort_order, search)
+        
+        try:
+            boundaries = sorted({float(value) for value in price_buckets.split(",") if value.strip()})
+        except ValueError:
+            boundaries = []
+        if not boundaries:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="price_buckets must be a comma-separated list of numbers"
+            )
+        
+        cache_key = (
+            "facets", category, search, featured,
+            None if min_price is None else float(min_price),
+            None if max_price is None else float(max_price),
+            sort_field, sort_direction, skip, limit, tuple(boundaries)
+        )
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            body, etag = cached
+            return conditional_response(request, body, etag, "sweets")
+        version = catalog_cache.version
+        
+        base_match = {}
+        ranked_ids = []
+        if search:
+            await search_index.ensure_built(db)
+            ranked_ids = [sweet_id for sweet_id, _ in search_index.search(search)]
+            base_match["id"] = {"$in": ranked_ids}
         
-        # Execute query
-        cursor = db.sweets.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
-        sweets = await cursor.to_list(length=limit)
+        if sort_field == "relevance":
+            sort_stages = [
+                {"$addFields": {"_rank": {"$indexOfArray": [ranked_ids, "$id"]}}},
+                {"$sort": {"_rank": sort_direction, "id": sort_direction}},
+                {"$project": {"_rank": 0}}
+            ]
+        else:
+            sort_stages = [{"$sort": {sort_field: sort_direction, "id": sort_direction}}]
         
-        return [Sweet(**sweet) for sweet in sweets]
+        # Each facet applies every filter except its own, so the sidebar still
+        # shows the alternatives to the current selection
+        pipeline = [
+            {"$match": base_match},
+            {"$facet": {
+                "items": [
+                    {"$match": merge_filters(filters)},
+                    *sort_stages,
+                    {"$skip": skip},
+                    {"$limit": limit},
+                    {"$project": {"_id": 0}}
+                ],
+                "total": [
+                    {"$match": merge_filters(filters)},
+                    {"$count": "count"}
+                ],
+                "categories": [
+                    {"$match": merge_filters(filters, "category")},
+                    {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}}
+                ],
+                "price_buckets": [
+                    {"$match": merge_filters(filters, "price")},
+                    {"$bucket": {
+                        "groupBy": "$price",
+                        "boundaries": boundaries + [float("inf")],
+                        "default": "other",
+                        "output": {"count": {"$sum": 1}}
+                    }}
+                ],
+                "featured": [
+                    {"$match": {**merge_filters(filters, "featured"), "featured": True}},
+                    {"$count": "count"}
+                ]
+            }}
+        ]
+        result = (await db.sweets.aggregate(pipeline).to_list(1))[0]
+        
+        bucket_counts = {bucket["_id"]: bucket["count"] for bucket in result["price_buckets"]}
+        facets = SweetFacets(
+            items=[Sweet(**sweet) for sweet in result["items"]],
+            total=result["total"][0]["count"] if result["total"] else 0,
+            categories=[FacetCount(value=entry["_id"], count=entry["count"]) for entry in result["categories"]],
+            price_buckets=[
+                PriceBucket(
+                    min=lower,
+                    max=boundaries[position + 1] if position + 1 < len(boundaries) else None,
+                    count=bucket_counts.get(lower, 0)
+                )
+                for position, lower in enumerate(boundaries)
+            ],
+            featured=result["featured"][0]["count"] if result["featured"] else 0
+        )
+        
+        body = render_json(facets)
+        etag = make_etag(body)
+        catalog_cache.set(cache_key, (body, etag), version)
+        return conditional_response(request, body, etag, "sweets")
+    
+    @router.post("/batch", response_model=List[SweetBatchItem])
+    async def get_sweets_batch(request: SweetBatchRequest):
+        projection = build_projection(request.fields, Sweet, {"summary": SweetSummary.model_fields})
+        
+        # One $in query for all ids, answered in the requested order
+        unique_ids = list(dict.fromkeys(request.ids))
+        found = {}
+        async for sweet in db.sweets.find({"id": {"$in": unique_ids}}, projection):
+            found[sweet["id"]] = sweet if projection else Sweet(**sweet)
+        
+        items = [
+            {"id": sweet_id, "found": True, "sweet": found[sweet_id]} if sweet_id in found
+            else {"id": sweet_id, "found": False}
+            for sweet_id in request.ids
+        ]
+        return Response(content=render_json(items), media_type="application/json")
     
     @router.get("/{sweet_id}", response_model=Sweet)
-    async def get_sweet(sweet_id: str):
-        sweet = await db.sweets.find_one({"id": sweet_id})
+    async def get_sweet(sweet_id: str, request: Request):
+        cache_key = ("sweet", sweet_id)
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            body, etag = cached
+            return conditional_response(request, body, etag, "sweet")
+        version = catalog_cache.version
+        
+        sweet = await find_sweet(db, sweet_id)
         if not sweet:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Sweet not found"
             )
-        return Sweet(**sweet)
+        body = render_json(Sweet(**sweet))
+        etag = make_etag(body)
+        catalog_cache.set(cache_key, (body, etag), version)
+        return conditional_response(request, body, etag, "sweet")
     
     @router.post("/", response_model=Sweet)
     async def create_sweet(
@@ -89,40 +334,135 @@ def create_sweets_router(db: AsyncIOMotorDatabase):
         )
         
         await db.sweets.insert_one(sweet.dict())
+        search_index.add(sweet.dict())
+        price_table.update(sweet.dict())
         
         # Update category counts
-        await get_category_counts(db)
+        await adjust_category_count(db, sweet.category, 1)
+        # Only after the counts, so readers can't cache old counts under the new version
+        catalog_cache.invalidate()
         
         return sweet
     
+    async def apply_import_chunk(chunk: List[Tuple[int, Dict[str, Any]]], report: BulkImportResponse):
+        # One lookup decides which rows update existing sweets
+        ids = [data["id"] for _, data in chunk if data.get("id")]
+        existing = set()
+        if ids:
+            async for doc in db.sweets.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}):
+                existing.add(doc["id"])
+        
+        now = datetime.utcnow()
+        operations = []
+        operation_rows = []
+        for row, data in chunk:
+            sweet_id = data.get("id")
+            try:
+                if sweet_id in existing:
+                    update = SweetUpdate(**data)
+                    update_data = {k: v for k, v in update.dict().items() if v is not None}
+                    update_data["updated_at"] = now
+                    operations.append(UpdateOne({"id": sweet_id}, {"$set": update_data}))
+                else:
+                    create = SweetCreate(**data)
+                    sweet_id = sweet_id or str(uuid.uuid4())
+                    set_fields = create.dict(exclude_unset=True)
+                    set_fields["updated_at"] = now
+                    new_sweet = Sweet(id=sweet_id, **create.dict(), created_at=now, updated_at=now).dict()
+                    on_insert = {k: v for k, v in new_sweet.items() if k not in set_fields}
+                    operations.append(UpdateOne(
+                        {"id": sweet_id},
+                        {"$set": set_fields, "$setOnInsert": on_insert},
+                        upsert=True
+                    ))
+                operation_rows.append((row, sweet_id))
+            except ValidationError as exc:
+                report.errors.append(BulkImportError(row=row, id=sweet_id, error=format_validation_error(exc)))
+        
+        if not operations:
+            return
+        try:
+            result = await db.sweets.bulk_write(operations, ordered=False)
+            report.inserted += result.upserted_count
+            report.updated += result.matched_count
+        except BulkWriteError as exc:
+            details = exc.details
+            report.inserted += details.get("nUpserted", 0)
+            report.updated += details.get("nMatched", 0)
+            for error in details.get("writeErrors", []):
+                row, sweet_id = operation_rows[error["index"]]
+                report.errors.append(BulkImportError(row=row, id=sweet_id, error=error.get("errmsg", "Write failed")))
+    
+    @router.post("/import", response_model=BulkImportResponse)
+    async def import_sweets(
+        request: Request,
+        format: Optional[str] = Query(None, description="ndjson or csv (default: from Content-Type)"),
+        current_user: User = Depends(get_admin_user)
+    ):
+        import_format = detect_format(request, format)
+        if import_format not in ("ndjson", "csv"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Format must be ndjson or csv"
+            )
+        
+        # Rows with a known id update that sweet; others create a new one
+        report = BulkImportResponse()
+        chunk = []
+        async for row, data in iter_records(request, import_format):
+            report.processed += 1
+            if isinstance(data, str):
+                report.errors.append(BulkImportError(row=row, error=data))
+                continue
+            chunk.append((row, data))
+            if len(chunk) >= BULK_IMPORT_CHUNK_SIZE:
+                await apply_import_chunk(chunk, report)
+                chunk = []
+        if chunk:
+            await apply_import_chunk(chunk, report)
+        
+        report.failed = len(report.errors)
+        report.errors.sort(key=lambda error: error.row)
+        
+        # Refresh derived state once for the whole import
+        if report.inserted or report.updated:
+            await search_index.rebuild(db)
+            price_table.expire()
+            await get_category_counts(db)
+            catalog_cache.invalidate()
+        
+        return report
+    
     @router.put("/{sweet_id}", response_model=Sweet)
     async def update_sweet(
         sweet_id: str,
         sweet_data: SweetUpdate,
         current_user: User = Depends(get_admin_user)
     ):
-        # Find existing sweet
-        existing_sweet = await db.sweets.find_one({"id": sweet_id})
-        if not existing_sweet:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Sweet not found"
-            )
-        
-        # Update fields
+        # Update fields, keeping the previous version for the category counts
         update_data = {k: v for k, v in sweet_data.dict().items() if v is not None}
         update_data["updated_at"] = datetime.utcnow()
         
-        await db.sweets.update_one(
+        existing_sweet = await db.sweets.find_one_and_update(
             {"id": sweet_id},
-            {"$set": update_data}
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
         )
+        if not existing_sweet:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Sweet not found"
+            )
         
-        # Get updated sweet
-        updated_sweet = await db.sweets.find_one({"id": sweet_id})
+        updated_sweet = {**existing_sweet, **update_data}
+        search_index.add(updated_sweet)
+        price_table.update(updated_sweet)
         
-        # Update category counts
-        await get_category_counts(db)
+        # Move the sweet between category counts if its category changed
+        if updated_sweet["category"] != existing_sweet["category"]:
+            await adjust_category_count(db, existing_sweet["category"], -1)
+            await adjust_category_count(db, updated_sweet["category"], 1)
+        catalog_cache.invalidate()
         
         return Sweet(**updated_sweet)
     
@@ -131,19 +471,19 @@ def create_sweets_router(db: AsyncIOMotorDatabase):
         sweet_id: str,
         current_user: User = Depends(get_admin_user)
     ):
-        # Find sweet
-        sweet = await db.sweets.find_one({"id": sweet_id})
+        # Delete sweet
+        sweet = await db.sweets.find_one_and_delete({"id": sweet_id})
         if not sweet:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Sweet not found"
             )
-        
-        # Delete sweet
-        await db.sweets.delete_one({"id": sweet_id})
+        search_index.remove(sweet_id)
+        price_table.discard(sweet_id)
         
         # Update category counts
-        await get_category_counts(db)
+        await adjust_category_count(db, sweet["category"], -1)
+        catalog_cache.invalidate()
         
         return MessageResponse(message="Sweet deleted successfully")
     
@@ -166,9 +506,11 @@ def create_sweets_router(db: AsyncIOMotorDatabase):
             {"id": sweet_id},
             {"$set": {"stock": stock, "updated_at": datetime.utcnow()}}
         )
+        catalog_cache.invalidate()
         
         # Get updated sweet
         updated_sweet = await db.sweets.find_one({"id": sweet_id})
+        price_table.update(updated_sweet)
         return Sweet(**updated_sweet)
     
     @router.patch("/{sweet_id}/featured", response_model=Sweet)
@@ -190,6 +532,7 @@ def create_sweets_router(db: AsyncIOMotorDatabase):
             {"id": sweet_id},
             {"$set": {"featured": featured, "updated_at": datetime.utcnow()}}
         )
+        catalog_cache.invalidate()
         
         # Get updated sweet
         updated_sweet = await db.sweets.find_one({"id": sweet_id})
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import Wishlist, WishlistItem, User, MessageResponse
 from auth import create_user_dependency
+from singleflight import find_sweet
 from datetime import datetime
 
 def create_wishlist_router(db: AsyncIOMotorDatabase):
@@ -25,7 +26,7 @@ def create_wishlist_router(db: AsyncIOMotorDatabase):
         current_user: User = Depends(get_current_user)
     ):
         # Find the sweet
-        sweet = await db.sweets.find_one({"id": sweet_id})
+        sweet = await find_sweet(db, sweet_id)
         if not sweet:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,200 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from bisect import bisect_left, insort
+import asyncio
+import math
+import os
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Field weights for the BM25F-style term frequency
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "category": 2.0,
+    "ingredients": 1.5,
+    "description": 1.0,
+}
+INDEXED_FIELDS = {"id": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms reached only through prefix expansion score less than exact matches
+PREFIX_MATCH_WEIGHT = 0.5
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Full rebuild interval; bounds staleness for catalog writes made by other processes
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "300"))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """In-memory inverted index over the sweets catalog.
+
+    Matching is AND across query terms, each term matching any indexed token
+    it is a prefix of. Results are ranked with BM25 over weighted fields.
+    Writes made through this process update it in place; ensure_built()
+    rebuilds it every ttl_seconds to pick up writes from other processes.
+    """
+
+    def __init__(self, ttl_seconds: float = SEARCH_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._expires_at = 0.0
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._total_length = 0.0
+        self._vocabulary: List[str] = []
+        self.ready = False
+        self._rebuild_lock = asyncio.Lock()
+        # Writes made while a rebuild is loading, replayed onto the new index
+        self._missed: Optional[List[Tuple[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    async def rebuild(self, db: AsyncIOMotorDatabase) -> None:
+        async with self._rebuild_lock:
+            await self._build(db)
+
+    def _is_fresh(self) -> bool:
+        return self.ready and self._expires_at > time.monotonic()
+
+    async def ensure_built(self, db: AsyncIOMotorDatabase) -> None:
+        """Build the index on first use and again once the TTL runs out"""
+        if self._is_fresh():
+            return
+        if self.ready and self._rebuild_lock.locked():
+            # Another task is already rebuilding; keep serving the current index
+            return
+        async with self._rebuild_lock:
+            if not self._is_fresh():
+                await self._build(db)
+
+    async def _build(self, db: AsyncIOMotorDatabase) -> None:
+        """Load a new index off to the side and swap it in, so searches never see a partial one"""
+        fresh = SearchIndex()
+        self._missed = []
+        try:
+            async for sweet in db.sweets.find({}, INDEXED_FIELDS):
+                fresh.add(sweet)
+            for op, arg in self._missed:
+                getattr(fresh, op)(arg)
+        finally:
+            self._missed = None
+
+        # No await from here on, so the swap is atomic for other tasks
+        self._postings = fresh._postings
+        self._doc_terms = fresh._doc_terms
+        self._doc_lengths = fresh._doc_lengths
+        self._total_length = fresh._total_length
+        self._vocabulary = fresh._vocabulary
+        self.ready = True
+        self._expires_at = time.monotonic() + self.ttl_seconds
+        logger.info(f"Search index built with {len(self)} sweets")
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0.0
+        self._vocabulary.clear()
+        self.ready = False
+        self._expires_at = 0.0
+
+    def add(self, sweet: Dict[str, Any]) -> None:
+        """Index a sweet document, replacing any previous version of it"""
+        if self._missed is not None:
+            self._missed.append(("add", sweet))
+        sweet_id = sweet["id"]
+        self._remove(sweet_id)
+
+        terms: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            value = sweet.get(field)
+            if isinstance(value, list):
+                value = " ".join(value)
+            for token in tokenize(value):
+                terms[token] = terms.get(token, 0.0) + weight
+                length += weight
+
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._vocabulary, term)
+            postings[sweet_id] = tf
+        self._doc_terms[sweet_id] = terms
+        self._doc_lengths[sweet_id] = length
+        self._total_length += length
+
+    def remove(self, sweet_id: str) -> None:
+        if self._missed is not None:
+            self._missed.append(("remove", sweet_id))
+        self._remove(sweet_id)
+
+    def _remove(self, sweet_id: str) -> None:
+        terms = self._doc_terms.pop(sweet_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[sweet_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+        self._total_length -= self._doc_lengths.pop(sweet_id)
+
+    def _expand(self, prefix: str) -> Iterable[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """Return (sweet_id, score) pairs matching every query term, best first"""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms or not self._doc_lengths:
+            return []
+
+        doc_count = len(self._doc_lengths)
+        avg_length = self._total_length / doc_count
+        scores: Optional[Dict[str, float]] = None
+
+        for query_term in query_terms:
+            term_scores: Dict[str, float] = {}
+            for term in self._expand(query_term):
+                postings = self._postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = 1.0 if term == query_term else PREFIX_MATCH_WEIGHT
+                for sweet_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[sweet_id] / avg_length)
+                    score = weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    term_scores[sweet_id] = term_scores.get(sweet_id, 0.0) + score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    sweet_id: score + term_scores[sweet_id]
+                    for sweet_id, score in scores.items()
+                    if sweet_id in term_scores
+                }
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+# Shared by every router so catalog writes keep the index current
+search_index = SearchIndex()
@@ -15,7 +15,17 @@ from routes.cart import create_cart_router
 from routes.wishlist import create_wishlist_router
 from routes.orders import create_orders_router
 from routes.admin import create_admin_router
-from database import init_database
+from database import init_database, ensure_indexes
+from cache import catalog_cache
+from search import search_index
+from singleflight import sweet_lookups
+from auth import user_cache, password_hasher, revocation_list
+from ratelimit import RateLimitMiddleware, rate_limiter
+from pricing import price_table
+from cart_store import cart_store
+from idempotency import idempotency_store
+from outbox import outbox
+from order_events import register_order_handlers
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -40,6 +50,22 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
+@api_router.get("/metrics")
+async def metrics():
+    return {
+        "catalog_cache": catalog_cache.stats(),
+        "sweet_lookups": sweet_lookups.stats(),
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "revocation_list": revocation_list.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "price_table": price_table.stats(),
+        "cart_store": cart_store.stats(),
+        "idempotency": idempotency_store.stats(),
+        "outbox": await outbox.stats(db),
+        "timestamp": datetime.utcnow()
+    }
+
 # Include all route modules
 api_router.include_router(create_auth_router(db))
 api_router.include_router(create_sweets_router(db))
@@ -52,12 +78,16 @@ api_router.include_router(create_admin_router(db))
 # Include the router in the main app
 app.include_router(api_router)
 
+# Added before CORS so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
 
 # Configure logging
@@ -70,10 +100,21 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Sweet Shop API...")
+    await ensure_indexes(db)
     await init_database(db)
     logger.info("Database initialized successfully")
+    await search_index.rebuild(db)
+    await price_table.refresh(db)
+    await revocation_list.start(db)
+    await cart_store.start(db)
+    register_order_handlers(outbox)
+    await outbox.start(db)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     logger.info("Shutting down Sweet Shop API...")
+    revocation_list.stop()
+    await outbox.stop()
+    await cart_store.stop(db)
+    password_hasher.shutdown()
     client.close()
@@ -0,0 +1,86 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from functools import partial
+from cache import catalog_cache
+import asyncio
+import os
+import time
+
+SWEET_LOOKUP_MEMO_SECONDS = float(os.getenv("SWEET_LOOKUP_MEMO_SECONDS", "0"))
+MAX_MEMO_ENTRIES = 10000
+
+
+class SingleFlight:
+    """Share one in-flight call, and optionally its result for a short window, per key.
+
+    Results are handed to every caller as the same object, so they must be
+    treated as read-only.
+    """
+
+    def __init__(self, memo_seconds: float = 0.0):
+        self.memo_seconds = memo_seconds
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._memo: Dict[Hashable, Tuple[float, Any]] = {}
+        self._generation = 0
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.memo_hits = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        memo = self._memo.get(key)
+        if memo is not None:
+            expires_at, value = memo
+            if expires_at > time.monotonic():
+                self.memo_hits += 1
+                return value
+            del self._memo[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(partial(self._finish, key, self._generation))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller going away doesn't cancel the shared query
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, generation: int, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.memo_seconds > 0 and generation == self._generation:
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                now = time.monotonic()
+                self._memo = {k: entry for k, entry in self._memo.items() if entry[0] > now}
+            if len(self._memo) < MAX_MEMO_ENTRIES:
+                self._memo[key] = (time.monotonic() + self.memo_seconds, task.result())
+
+    def clear(self) -> None:
+        """Drop memoized results and detach in-flight calls so new callers re-query"""
+        self._generation += 1
+        self._memo.clear()
+        self._in_flight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "memo_hits": self.memo_hits,
+            "in_flight": len(self._in_flight),
+            "memo_seconds": self.memo_seconds,
+        }
+
+
+sweet_lookups = SingleFlight(memo_seconds=SWEET_LOOKUP_MEMO_SECONDS)
+catalog_cache.add_listener(sweet_lookups.clear)
+
+
+async def find_sweet(db: AsyncIOMotorDatabase, sweet_id: str) -> Optional[Dict[str, Any]]:
+    """find_one a sweet by id, coalescing concurrent lookups of the same id"""
+    return await sweet_lookups.do(sweet_id, lambda: db.sweets.find_one({"id": sweet_id}))
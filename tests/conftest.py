@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI
+from mongomock_motor import AsyncMongoMockClient
+
+from cache import catalog_cache
+from database import ensure_indexes
+from idempotency import idempotency_store
+from order_events import register_order_handlers
+from outbox import outbox
+from pricing import price_table
+from search import search_index
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    # Module-level singletons outlive each test's database
+    catalog_cache.invalidate()
+    price_table.expire()
+    search_index.clear()
+    idempotency_store.responses.clear()
+    yield
+
+
+@pytest.fixture
+async def db():
+    database = AsyncMongoMockClient()["sweet_shop_test"]
+    await ensure_indexes(database)
+    return database
+
+
+@pytest.fixture
+async def client(db):
+    from routes.admin import create_admin_router
+    from routes.auth import create_auth_router
+    from routes.cart import create_cart_router
+    from routes.orders import create_orders_router
+    from routes.sweets import create_sweets_router
+
+    register_order_handlers(outbox)
+    app = FastAPI()
+    api_router = APIRouter(prefix="/api")
+    for create_router in (create_auth_router, create_sweets_router, create_cart_router, create_orders_router, create_admin_router):
+        api_router.include_router(create_router(db))
+    app.include_router(api_router)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as test_client:
+        yield test_client
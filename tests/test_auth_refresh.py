@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from auth import revocation_list
+from tests.utils import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def login(client):
+    response = await client.post("/api/auth/login", json={"email": "buyer@example.com", "password": "secret-password"})
+    return response.json()["refresh_token"]
+
+
+async def test_concurrent_refreshes_with_one_token_only_succeed_once(client):
+    await register(client, "buyer@example.com")
+    refresh_token = await login(client)
+
+    responses = await asyncio.gather(*[
+        client.post("/api/auth/refresh", json={"refresh_token": refresh_token}) for _ in range(5)
+    ])
+
+    assert sorted(response.status_code for response in responses) == [200, 401, 401, 401, 401]
+
+
+async def test_reuse_is_rejected_by_a_worker_that_has_not_reloaded(client, monkeypatch):
+    await register(client, "buyer@example.com")
+    refresh_token = await login(client)
+    assert (await client.post("/api/auth/refresh", json={"refresh_token": refresh_token})).status_code == 200
+
+    # Another worker's in-memory list doesn't know about the revocation yet
+    monkeypatch.setattr(revocation_list, "_revoked", set())
+    response = await client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Refresh token has already been used"
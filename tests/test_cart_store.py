@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from cart_store import MongoCartStore, WriteBehindCartStore
+from tests.utils import insert_sweet, register
+
+pytestmark = pytest.mark.anyio
+
+
+def line(sweet_id: str, price: float = 10.0, quantity: int = 1):
+    return {"sweet_id": sweet_id, "name": f"Sweet {sweet_id}", "price": price, "quantity": quantity}
+
+
+async def test_concurrent_adds_share_one_cart_and_line(db):
+    store = MongoCartStore()
+
+    await asyncio.gather(*[store.add_item(db, "user-1", line("a")) for _ in range(10)])
+
+    carts = await db.carts.find({"user_id": "user-1"}).to_list(None)
+    assert len(carts) == 1
+    assert [(item["sweet_id"], item["quantity"]) for item in carts[0]["items"]] == [("a", 10)]
+    assert carts[0]["total"] == 100.0
+
+
+async def test_add_at_new_price_keeps_line_snapshot_price(db):
+    store = MongoCartStore()
+    await store.add_item(db, "user-1", line("a", price=10.0))
+
+    cart = await store.add_item(db, "user-1", line("a", price=12.0, quantity=2))
+
+    assert [(item["price"], item["quantity"]) for item in cart["items"]] == [(10.0, 3)]
+    assert cart["total"] == 30.0
+
+
+async def test_set_quantity_and_remove_keep_total_exact(db):
+    store = MongoCartStore()
+    for _ in range(10):
+        await store.add_item(db, "user-1", line("a", price=0.1))
+    await store.add_item(db, "user-1", line("b", price=0.2, quantity=3))
+
+    cart = await store.set_quantity(db, "user-1", "a", 7)
+    assert cart["total"] == 1.3
+    cart = await store.remove_item(db, "user-1", "b")
+    assert cart["total"] == 0.7
+    assert (await db.carts.find_one({"user_id": "user-1"}))["total"] == 0.7
+
+
+async def test_set_quantity_on_missing_line_returns_none(db):
+    store = MongoCartStore()
+    await store.add_item(db, "user-1", line("a"))
+
+    assert await store.set_quantity(db, "user-1", "missing", 2) is None
+
+
+async def test_add_items_increments_existing_lines_and_appends_new_ones(db):
+    store = MongoCartStore()
+    await store.add_items(db, "user-1", [line("a", price=1.1), line("b", price=2.0)])
+
+    cart = await store.add_items(db, "user-1", [line("a", price=9.9, quantity=2), line("c", price=0.3), line("b", quantity=3)])
+
+    assert [(item["sweet_id"], item["price"], item["quantity"]) for item in cart["items"]] == [
+        ("a", 1.1, 3), ("b", 2.0, 4), ("c", 0.3, 1),
+    ]
+    assert cart["total"] == 11.6
+
+
+async def test_add_items_creates_the_cart_in_the_same_update(db):
+    store = MongoCartStore()
+
+    cart = await store.add_items(db, "user-1", [line("a", price=0.1, quantity=3), line("b", price=0.2)])
+
+    stored = await db.carts.find_one({"user_id": "user-1"})
+    assert stored["id"] == cart["id"] and stored["created_at"] == cart["created_at"]
+    assert [(item["sweet_id"], item["quantity"]) for item in stored["items"]] == [("a", 3), ("b", 1)]
+    assert stored["total"] == 0.5
+
+
+async def test_concurrent_mixed_add_items_lose_nothing(db):
+    store = MongoCartStore()
+
+    await asyncio.gather(*[
+        store.add_items(db, "user-1", [line("shared"), line(f"own-{index}")])
+        for index in range(10)
+    ])
+
+    cart = await db.carts.find_one({"user_id": "user-1"})
+    quantities = {item["sweet_id"]: item["quantity"] for item in cart["items"]}
+    assert quantities == {"shared": 10, **{f"own-{index}": 1 for index in range(10)}}
+    assert cart["total"] == 200.0
+
+
+async def test_add_many_endpoint_reports_per_item_failures(db, client):
+    await insert_sweet(db, "in-cart", stock=10)
+    await insert_sweet(db, "new", stock=10)
+    await insert_sweet(db, "scarce", stock=1)
+    _, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "in-cart", "quantity": 1})
+
+    response = await client.post("/api/cart/add-many", headers=headers, json={"items": [
+        {"sweet_id": "in-cart", "quantity": 1},
+        {"sweet_id": "new", "quantity": 2},
+        {"sweet_id": "scarce", "quantity": 5},
+        {"sweet_id": "missing", "quantity": 1},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert {item["sweet_id"]: item["quantity"] for item in body["cart"]["items"]} == {"in-cart": 2, "new": 2}
+    assert {failure["sweet_id"]: failure["error"] for failure in body["failed"]} == {
+        "scarce": "Not enough stock available",
+        "missing": "Sweet not found",
+    }
+
+
+async def test_write_behind_flush_writes_dirty_carts(db):
+    store = WriteBehindCartStore()
+    await store.add_item(db, "user-1", line("a", quantity=2))
+    assert await db.carts.count_documents({}) == 0
+
+    assert await store.flush(db) == 1
+
+    cart = await db.carts.find_one({"user_id": "user-1"})
+    assert cart["items"][0]["quantity"] == 2
+    assert cart["total"] == 20.0
+
+
+@pytest.mark.parametrize("store_type", [MongoCartStore, WriteBehindCartStore])
+async def test_remove_ordered_applies_each_order_once(db, store_type):
+    store = store_type()
+    await store.add_items(db, "user-1", [line("a", quantity=3), line("b")])
+
+    await store.remove_ordered(db, "user-1", {"a": 1, "b": 1}, "order-1")
+    await store.remove_ordered(db, "user-1", {"a": 1, "b": 1}, "order-1")
+
+    cart = await store.get(db, "user-1")
+    assert [(item["sweet_id"], item["quantity"]) for item in cart["items"]] == [("a", 2)]
+    assert cart["total"] == 20.0
+
+
+async def test_write_behind_stop_writes_carts_whose_flush_was_cancelled(db, monkeypatch):
+    store = WriteBehindCartStore(flush_interval=0.01)
+    for index in range(5):
+        await store.add_item(db, f"user-{index}", line("a"))
+
+    collection_type = type(db.carts)
+    bulk_write = collection_type.bulk_write
+
+    async def slow_bulk_write(self, *args, **kwargs):
+        await asyncio.sleep(10)
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "bulk_write", slow_bulk_write)
+    await store.start(db)
+    await asyncio.sleep(0.05)
+    monkeypatch.setattr(collection_type, "bulk_write", bulk_write)
+
+    await store.stop(db)
+
+    assert await db.carts.count_documents({}) == 5
+    assert store.stats()["dirty"] == 0
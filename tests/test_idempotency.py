@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from idempotency import IdempotencyStore, fingerprint
+from tests.utils import insert_sweet, register
+
+pytestmark = pytest.mark.anyio
+
+
+class Counter:
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        return {"id": f"order-{self.calls}"}
+
+
+async def test_retry_replays_the_first_response(db):
+    store = IdempotencyStore()
+    create = Counter()
+
+    first = await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create)
+    second = await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create)
+
+    assert first == ({"id": "order-1"}, False)
+    assert second == ({"id": "order-1"}, True)
+    assert create.calls == 1
+
+
+async def test_concurrent_duplicates_run_once(db):
+    store = IdempotencyStore()
+    create = Counter()
+
+    results = await asyncio.gather(*[
+        store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create) for _ in range(5)
+    ])
+
+    assert create.calls == 1
+    assert {response["id"] for response, _ in results} == {"order-1"}
+
+
+async def test_other_process_replays_from_mongodb(db):
+    create = Counter()
+    await IdempotencyStore().run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create)
+
+    response, replayed = await IdempotencyStore().run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create)
+
+    assert (response, replayed) == ({"id": "order-1"}, True)
+    assert create.calls == 1
+
+
+async def test_key_reused_for_a_different_request_is_rejected(db):
+    store = IdempotencyStore()
+    await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), Counter())
+
+    with pytest.raises(HTTPException) as error:
+        await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 2}), Counter())
+
+    assert error.value.status_code == 422
+
+
+async def test_failed_attempt_releases_the_key(db):
+    store = IdempotencyStore()
+    with pytest.raises(HTTPException):
+        await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), Counter(fail=True))
+
+    create = Counter()
+    response, replayed = await store.run(db, "orders:user-1", "key-1", fingerprint({"a": 1}), create)
+
+    assert (response, replayed) == ({"id": "order-1"}, False)
+
+
+async def test_order_retry_with_same_key_returns_the_same_order(db, client):
+    await insert_sweet(db, "a", stock=10)
+    _, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 2})
+    order = {"address": "1 Sugar Lane", "phone": "555-0100"}
+    retry_headers = {**headers, "Idempotency-Key": "checkout-1"}
+
+    first = await client.post("/api/orders/", headers=retry_headers, json=order)
+    second = await client.post("/api/orders/", headers=retry_headers, json=order)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert await db.orders.count_documents({}) == 1
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 8
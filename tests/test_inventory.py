@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import inventory
+from inventory import release_stock, reserve_stock
+from tests.utils import insert_sweet
+
+pytestmark = pytest.mark.anyio
+
+
+def order_line(sweet_id: str, quantity: int):
+    return {"sweet_id": sweet_id, "name": f"Sweet {sweet_id}", "quantity": quantity}
+
+
+async def stock_of(db, sweet_id: str) -> int:
+    return (await db.sweets.find_one({"id": sweet_id}))["stock"]
+
+
+async def test_reserve_takes_stock_for_every_line(db):
+    await insert_sweet(db, "a", stock=5)
+    await insert_sweet(db, "b", stock=5)
+
+    await reserve_stock(db, [order_line("a", 2), order_line("b", 1), order_line("a", 1)])
+
+    assert await stock_of(db, "a") == 2
+    assert await stock_of(db, "b") == 4
+    assert await db.sweets.count_documents({"holds.0": {"$exists": True}}) == 0
+
+
+async def test_releasing_holds_only_touches_reserved_sweets(db, monkeypatch):
+    await insert_sweet(db, "a", stock=5)
+    await insert_sweet(db, "other", stock=5)
+    monkeypatch.setattr(inventory.uuid, "uuid4", lambda: "hold-1")
+    await db.sweets.update_one({"id": "other"}, {"$set": {"holds": ["hold-1"]}})
+
+    await reserve_stock(db, [order_line("a", 1)])
+
+    assert (await db.sweets.find_one({"id": "a"}))["holds"] == []
+    assert (await db.sweets.find_one({"id": "other"}))["holds"] == ["hold-1"]
+
+
+async def test_shortfall_gives_back_lines_already_taken(db):
+    await insert_sweet(db, "a", stock=5)
+    await insert_sweet(db, "b", stock=1)
+
+    with pytest.raises(HTTPException) as error:
+        await reserve_stock(db, [order_line("a", 2), order_line("b", 3)])
+
+    assert error.value.status_code == 400
+    assert error.value.detail == "Not enough stock for Sweet b"
+    assert await stock_of(db, "a") == 5
+    assert await stock_of(db, "b") == 1
+
+
+async def test_missing_sweet_fails_without_creating_a_document(db):
+    await insert_sweet(db, "a", stock=5)
+
+    with pytest.raises(HTTPException) as error:
+        await reserve_stock(db, [order_line("a", 1), order_line("deleted", 1)])
+
+    assert error.value.detail == "Not enough stock for Sweet deleted"
+    assert await db.sweets.count_documents({}) == 1
+    assert await stock_of(db, "a") == 5
+
+
+async def test_concurrent_reservations_never_oversell(db):
+    await insert_sweet(db, "a", stock=5)
+    await insert_sweet(db, "b", stock=100)
+
+    results = await asyncio.gather(
+        *[reserve_stock(db, [order_line("b", 1), order_line("a", 1)]) for _ in range(8)],
+        return_exceptions=True
+    )
+
+    assert sum(result is None for result in results) == 5
+    assert await stock_of(db, "a") == 0
+    assert await stock_of(db, "b") == 95
+
+
+async def test_release_gives_stock_back(db):
+    await insert_sweet(db, "a", stock=1)
+
+    await release_stock(db, [order_line("a", 2), order_line("a", 1)])
+
+    assert await stock_of(db, "a") == 4
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Order, OrderItem
+from tests.utils import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def insert_orders(db, user_id: str, created_at):
+    for index, created in enumerate(created_at):
+        order = Order(
+            id=f"order-{index:02d}",
+            user_id=user_id,
+            items=[OrderItem(sweet_id="a", name="Sweet a", quantity=index + 1, price=2.0, image="")],
+            total=2.0 * (index + 1),
+            address="1 Sugar Lane",
+            phone="555-0100",
+            created_at=created,
+        )
+        await db.orders.insert_one(order.dict())
+
+
+async def fetch_all_pages(client, headers, limit: int):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/orders/", headers=headers, params=params)
+        assert response.status_code == 200
+        ids.extend(order["id"] for order in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+async def test_pages_cover_every_order_once_with_tied_timestamps(db, client):
+    user_id, headers = await register(client, "buyer@example.com")
+    now = datetime(2024, 1, 1)
+    # Orders 2-5 share a timestamp, so only the id tie-breaker orders them
+    await insert_orders(db, user_id, [now, now + timedelta(minutes=1)] + [now + timedelta(minutes=2)] * 4 + [now + timedelta(minutes=3)])
+
+    ids = await fetch_all_pages(client, headers, limit=2)
+
+    assert ids == ["order-06", "order-05", "order-04", "order-03", "order-02", "order-01", "order-00"]
+
+
+async def test_summaries_count_items_without_returning_them(db, client):
+    user_id, headers = await register(client, "buyer@example.com")
+    await insert_orders(db, user_id, [datetime(2024, 1, 1)])
+
+    response = await client.get("/api/orders/", headers=headers)
+
+    assert response.json() == [{
+        "id": "order-00",
+        "status": "pending",
+        "total": 2.0,
+        "created_at": "2024-01-01T00:00:00",
+        "item_count": 1,
+    }]
+
+
+async def test_only_the_users_own_orders_are_listed(db, client):
+    _, headers = await register(client, "buyer@example.com")
+    await insert_orders(db, "someone-else", [datetime(2024, 1, 1)])
+
+    response = await client.get("/api/orders/", headers=headers)
+
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+
+async def test_invalid_cursor_is_rejected(client):
+    _, headers = await register(client, "buyer@example.com")
+
+    response = await client.get("/api/orders/", headers=headers, params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
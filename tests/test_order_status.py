@@ -0,0 +1,110 @@
+import pytest
+
+from outbox import outbox
+from tests.utils import insert_sweet, register
+
+pytestmark = pytest.mark.anyio
+
+ORDER = {"address": "1 Sugar Lane", "phone": "555-0100"}
+
+
+@pytest.fixture
+async def admin_headers(client):
+    _, headers = await register(client, "admin@example.com", role="admin")
+    return headers
+
+
+async def place_orders(db, client, count: int, quantity: int = 1):
+    await insert_sweet(db, "a", stock=100)
+    _, headers = await register(client, "buyer@example.com")
+    order_ids = []
+    for _ in range(count):
+        await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": quantity})
+        order_ids.append((await client.post("/api/orders/", headers=headers, json=ORDER)).json()["id"])
+    return order_ids, headers
+
+
+async def change_status(client, admin_headers, order_id: str, new_status: str):
+    return await client.patch(f"/api/admin/order/{order_id}/status", headers=admin_headers, params={"status": new_status})
+
+
+async def test_orders_move_through_the_lifecycle_one_step_at_a_time(db, client, admin_headers):
+    (order_id,), _ = await place_orders(db, client, 1)
+
+    skipped = await change_status(client, admin_headers, order_id, "delivered")
+    assert skipped.status_code == 400
+    assert skipped.json()["detail"] == "Cannot change status from pending to delivered"
+
+    for new_status in ("confirmed", "preparing", "ready", "delivered"):
+        assert (await change_status(client, admin_headers, order_id, new_status)).status_code == 200
+
+    final = await change_status(client, admin_headers, order_id, "cancelled")
+    assert final.status_code == 400
+    assert (await db.orders.find_one({"id": order_id}))["status"] == "delivered"
+
+
+async def test_single_change_validates_status_and_order(client, admin_headers):
+    assert (await change_status(client, admin_headers, "missing", "confirmed")).status_code == 404
+    assert (await change_status(client, admin_headers, "missing", "completed")).status_code == 422
+
+
+async def test_bulk_change_applies_valid_changes_and_reports_the_rest(db, client, admin_headers):
+    order_ids, _ = await place_orders(db, client, 3)
+    await db.orders.update_one({"id": order_ids[2]}, {"$set": {"status": "completed"}})
+
+    response = await client.post("/api/admin/orders/status", headers=admin_headers, json={"changes": [
+        {"order_id": order_ids[0], "status": "confirmed"},
+        {"order_id": order_ids[1], "status": "ready"},
+        {"order_id": order_ids[2], "status": "cancelled"},
+        {"order_id": "missing", "status": "cancelled"},
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["updated"] == [order_ids[0]]
+    assert {failure["order_id"]: failure["error"] for failure in body["failed"]} == {
+        order_ids[1]: "Cannot change status from pending to ready",
+        order_ids[2]: "Order has unknown status completed",
+        "missing": "Order not found",
+    }
+    statuses = {order["id"]: order["status"] async for order in db.orders.find({}, {"id": 1, "status": 1})}
+    assert statuses == {order_ids[0]: "confirmed", order_ids[1]: "pending", order_ids[2]: "completed"}
+
+
+async def test_bulk_cancellation_restores_stock_through_the_outbox(db, client, admin_headers):
+    order_ids, _ = await place_orders(db, client, 3, quantity=2)
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 94
+
+    response = await client.post("/api/admin/orders/status", headers=admin_headers, json={"changes": [
+        {"order_id": order_id, "status": "cancelled"} for order_id in order_ids
+    ]})
+    assert sorted(response.json()["updated"]) == sorted(order_ids)
+    assert await db.outbox.count_documents({"type": "order.cancelled", "status": "pending"}) == 3
+
+    await outbox.process_batch(db)
+
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 100
+
+
+async def test_customers_cannot_cancel_delivered_or_legacy_orders(db, client, admin_headers):
+    order_ids, headers = await place_orders(db, client, 2)
+    for new_status in ("confirmed", "preparing", "ready", "delivered"):
+        await change_status(client, admin_headers, order_ids[0], new_status)
+    await db.orders.update_one({"id": order_ids[1]}, {"$set": {"status": "shipped"}})
+
+    for order_id in order_ids:
+        response = await client.patch(f"/api/orders/{order_id}/cancel", headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Order cannot be cancelled"
+
+
+async def test_dashboard_counts_every_status(db, client, admin_headers):
+    order_ids, _ = await place_orders(db, client, 2)
+    await change_status(client, admin_headers, order_ids[0], "confirmed")
+
+    response = await client.get("/api/admin/dashboard-data", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json()["order_stats"] == {
+        "total": 2, "pending": 1, "confirmed": 1, "preparing": 0, "ready": 0, "delivered": 0, "cancelled": 0,
+    }
@@ -0,0 +1,169 @@
+from datetime import datetime
+
+import pytest
+
+import outbox as outbox_module
+from cart_store import cart_store
+from outbox import OutboxWorker, outbox
+from order_events import remove_ordered_lines, restore_cancelled_stock
+from tests.utils import insert_sweet, register
+
+pytestmark = pytest.mark.anyio
+
+ORDER = {"address": "1 Sugar Lane", "phone": "555-0100"}
+
+
+async def test_events_are_handed_to_their_handler_in_one_batch(db):
+    worker = OutboxWorker()
+    batches = []
+
+    @worker.handler("test.event")
+    async def handle(db, events):
+        batches.append([event["payload"]["n"] for event in events])
+
+    await worker.enqueue_many(db, "test.event", [{"n": 1}, {"n": 2}, {"n": 3}])
+
+    assert await worker.process_batch(db) == 3
+    assert batches == [[1, 2, 3]]
+    assert await db.outbox.count_documents({"status": "done"}) == 3
+    assert await worker.process_batch(db) == 0
+
+
+async def test_failed_batches_back_off_then_give_up(db, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_ATTEMPTS", 2)
+    worker = OutboxWorker()
+
+    @worker.handler("test.event")
+    async def handle(db, events):
+        raise RuntimeError("downstream unavailable")
+
+    await worker.enqueue(db, "test.event", {})
+    await worker.process_batch(db)
+
+    event = await db.outbox.find_one({})
+    assert (event["status"], event["attempts"], event["last_error"]) == ("pending", 1, "downstream unavailable")
+    assert event["available_at"] > datetime.utcnow()
+    assert await worker.process_batch(db) == 0
+
+    await db.outbox.update_one({}, {"$set": {"available_at": datetime.utcnow()}})
+    await worker.process_batch(db)
+
+    event = await db.outbox.find_one({})
+    assert (event["status"], event["attempts"]) == ("failed", 2)
+    assert (await worker.stats(db))["failed_events"] == 1
+
+
+async def test_events_without_a_handler_are_retried(db):
+    worker = OutboxWorker()
+    await worker.enqueue(db, "test.unknown", {})
+
+    await worker.process_batch(db)
+
+    event = await db.outbox.find_one({})
+    assert event["status"] == "pending"
+    assert "No outbox handler" in event["last_error"]
+
+
+async def cart_lines(db, user_id: str):
+    cart = await db.carts.find_one({"user_id": user_id})
+    return [(item["sweet_id"], item["quantity"]) for item in cart["items"]]
+
+
+async def test_worker_removes_the_ordered_lines_when_checkout_could_not(db, client, monkeypatch):
+    await insert_sweet(db, "a", stock=10)
+    user_id, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 2})
+
+    async def unavailable(*args, **kwargs):
+        raise RuntimeError("cart store unavailable")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(type(cart_store), "remove_ordered", unavailable)
+        response = await client.post("/api/orders/", headers=headers, json=ORDER)
+
+    assert response.status_code == 200
+    event = await db.outbox.find_one({"type": "order.placed"})
+    assert event["payload"] == {"order_id": response.json()["id"], "user_id": user_id, "quantities": {"a": 2}}
+    assert await cart_lines(db, user_id) == [("a", 2)]
+
+    await outbox.process_batch(db)
+
+    assert await cart_lines(db, user_id) == []
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 8
+
+
+async def test_ordered_lines_are_removed_once_and_later_lines_kept(db, client):
+    await insert_sweet(db, "a", stock=10)
+    await insert_sweet(db, "b", stock=10)
+    user_id, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 1})
+    order_id = (await client.post("/api/orders/", headers=headers, json=ORDER)).json()["id"]
+    assert await cart_lines(db, user_id) == []
+
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 2})
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "b", "quantity": 1})
+    # The worker and any redelivery find the order already applied
+    await outbox.process_batch(db)
+    await remove_ordered_lines(db, [{"payload": {"order_id": order_id, "user_id": user_id, "quantities": {"a": 1}}}])
+
+    assert await cart_lines(db, user_id) == [("a", 2), ("b", 1)]
+    assert (await db.carts.find_one({"user_id": user_id}))["total"] == 30.0
+    assert await db.outbox.count_documents({"type": "order.placed", "status": "done"}) == 1
+
+
+async def test_checkout_succeeds_when_enqueue_fails(db, client, monkeypatch):
+    await insert_sweet(db, "a", stock=10)
+    user_id, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 2})
+
+    async def unavailable(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+
+    monkeypatch.setattr(outbox, "enqueue", unavailable)
+    response = await client.post("/api/orders/", headers=headers, json=ORDER)
+
+    assert response.status_code == 200
+    assert await cart_lines(db, user_id) == []
+    assert await db.orders.count_documents({}) == 1
+
+
+async def test_next_checkout_is_not_blocked_by_the_previous_one(db, client):
+    await insert_sweet(db, "a", stock=10)
+    _, headers = await register(client, "buyer@example.com")
+
+    for _ in range(2):
+        await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 1})
+        assert (await client.post("/api/orders/", headers=headers, json=ORDER)).status_code == 200
+
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 8
+
+
+async def test_cancelled_stock_is_restored_once(db, client):
+    await insert_sweet(db, "a", stock=10)
+    _, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 3})
+    order_id = (await client.post("/api/orders/", headers=headers, json=ORDER)).json()["id"]
+
+    assert (await client.patch(f"/api/orders/{order_id}/cancel", headers=headers)).status_code == 200
+    await outbox.process_batch(db)
+    # Redelivery of the same event must not restore the stock again
+    await restore_cancelled_stock(db, [{"payload": {"order_id": order_id}}])
+
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 10
+
+
+async def test_cancel_restores_stock_inline_when_enqueue_fails(db, client, monkeypatch):
+    await insert_sweet(db, "a", stock=10)
+    _, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 3})
+    order_id = (await client.post("/api/orders/", headers=headers, json=ORDER)).json()["id"]
+
+    async def unavailable(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+
+    monkeypatch.setattr(outbox, "enqueue", unavailable)
+    response = await client.patch(f"/api/orders/{order_id}/cancel", headers=headers)
+
+    assert response.status_code == 200
+    assert (await db.sweets.find_one({"id": "a"}))["stock"] == 10
+    assert (await db.orders.find_one({"id": order_id}))["status"] == "cancelled"
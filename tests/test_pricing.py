@@ -0,0 +1,27 @@
+import pytest
+
+from pricing import price_table
+from tests.utils import insert_sweet, register
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_catalog_writes_update_entries_without_a_full_reload(db, client):
+    await insert_sweet(db, "a", price=10.0, stock=10)
+    await insert_sweet(db, "b", price=5.0, stock=10)
+    _, admin_headers = await register(client, "admin@example.com", role="admin")
+    _, headers = await register(client, "buyer@example.com")
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 2})
+    await client.get("/api/cart/", headers=headers)
+    loads = price_table.loads
+
+    await client.post("/api/orders/", headers=headers, json={"address": "1 Sugar Lane", "phone": "555-0100"})
+    await client.post("/api/cart/add", headers=headers, json={"sweet_id": "a", "quantity": 1})
+    await client.put("/api/sweets/a", headers=admin_headers, json={"price": 12.0})
+    await client.delete("/api/sweets/b", headers=admin_headers)
+    cart = (await client.get("/api/cart/", headers=headers)).json()
+
+    assert price_table.loads == loads
+    assert price_table._entries["a"] == (12.0, 8)
+    assert "b" not in price_table
+    assert (cart["items"][0]["price"], cart["items"][0]["added_price"], cart["has_changes"]) == (12.0, 10.0, True)
@@ -0,0 +1,75 @@
+import httpx
+import pytest
+
+from auth import create_access_token
+from ratelimit import RateLimiter, RateLimitMiddleware
+
+pytestmark = pytest.mark.anyio
+
+ORDERS = "POST /api/orders"
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+@pytest.fixture
+def limiter():
+    # One token a minute, so nothing refills while a test runs
+    return RateLimiter({
+        "POST /api/orders/": {
+            "user": {"per_minute": 1, "burst": 1},
+            "ip": {"per_minute": 1, "burst": 3},
+        },
+    })
+
+
+@pytest.fixture
+async def client(limiter):
+    app = RateLimitMiddleware(ok_app, limiter=limiter)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as test_client:
+        yield test_client
+
+
+def as_user(user_id: str):
+    return {"Authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+
+
+async def test_burst_beyond_the_limit_gets_429_with_retry_after(client):
+    statuses = [(await client.post("/api/orders")).status_code for _ in range(3)]
+    response = await client.post("/api/orders")
+
+    assert statuses == [200, 200, 200]
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert 55 <= int(response.headers["Retry-After"]) <= 60
+
+
+async def test_rejection_by_one_scope_leaves_the_other_untouched(client):
+    assert (await client.post("/api/orders", headers=as_user("a"))).status_code == 200
+    # Over the user limit; the IP bucket must not pay for it
+    for _ in range(3):
+        assert (await client.post("/api/orders", headers=as_user("a"))).status_code == 429
+
+    assert (await client.post("/api/orders", headers=as_user("b"))).status_code == 200
+    assert (await client.post("/api/orders", headers=as_user("c"))).status_code == 200
+    assert (await client.post("/api/orders", headers=as_user("d"))).status_code == 429
+
+
+async def test_paths_match_with_or_without_a_trailing_slash(client):
+    for path in ("/api/orders/", "/api/orders", "/api/orders/"):
+        assert (await client.post(path)).status_code == 200
+
+    assert (await client.post("/api/orders")).status_code == 429
+    assert (await client.get("/api/orders/")).status_code == 200
+
+
+async def test_rejections_are_counted_in_stats(client, limiter):
+    for _ in range(5):
+        await client.post("/api/orders")
+
+    stats = limiter.stats()
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == {ORDERS: 2}
+    assert stats["rejected_total"] == 2
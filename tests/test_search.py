@@ -0,0 +1,31 @@
+import pytest
+
+from search import SearchIndex
+from tests.utils import insert_sweet
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_fresh_index_is_not_rebuilt(db):
+    index = SearchIndex(ttl_seconds=60)
+    await insert_sweet(db, "a")
+    await index.ensure_built(db)
+
+    # Written by another process, so this index only sees it after a rebuild
+    await insert_sweet(db, "b")
+    await index.ensure_built(db)
+
+    assert len(index) == 1
+
+
+async def test_expired_index_picks_up_writes_from_other_processes(db):
+    index = SearchIndex(ttl_seconds=0)
+    await insert_sweet(db, "a")
+    await index.ensure_built(db)
+
+    await insert_sweet(db, "b")
+    await db.sweets.delete_one({"id": "a"})
+    await index.ensure_built(db)
+
+    assert len(index) == 1
+    assert [sweet_id for sweet_id, _ in index.search("sweet")] == ["b"]
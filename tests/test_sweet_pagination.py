@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.utils import insert_sweet
+
+pytestmark = pytest.mark.anyio
+
+# Every sort field has ties, so only the id tie-breaker keeps pages apart
+SWEETS = {
+    "s0": {"name": "Toffee", "price": 2.0, "rating": 4.5, "created_at": 0},
+    "s1": {"name": "Fudge", "price": 1.0, "rating": 4.5, "created_at": 0},
+    "s2": {"name": "Toffee", "price": 2.0, "rating": 3.0, "created_at": 1},
+    "s3": {"name": "Fudge", "price": 2.0, "rating": 5.0, "created_at": 1},
+    "s4": {"name": "Mint", "price": 1.0, "rating": 3.0, "created_at": 1},
+    "s5": {"name": "Toffee", "price": 3.0, "rating": 4.5, "created_at": 2},
+    "s6": {"name": "Mint", "price": 2.0, "rating": 4.5, "created_at": 0},
+}
+
+
+@pytest.fixture
+async def catalog(db):
+    start = datetime(2024, 1, 1)
+    for sweet_id, fields in SWEETS.items():
+        await insert_sweet(db, sweet_id, price=fields["price"])
+        await db.sweets.update_one({"id": sweet_id}, {"$set": {
+            "name": fields["name"],
+            "rating": fields["rating"],
+            "created_at": start + timedelta(minutes=fields["created_at"]),
+        }})
+    # Scores ahead of the rest, which all tie on "sweet"
+    await db.sweets.update_one({"id": "s4"}, {"$set": {"description": "A sweet sweet"}})
+
+
+async def fetch_all_pages(client, limit: int, **params):
+    ids, cursor = [], None
+    while True:
+        page = {**params, "limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/sweets/", params=page)
+        assert response.status_code == 200, response.text
+        ids.extend(sweet["id"] for sweet in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+@pytest.mark.parametrize("fields", [None, "summary"])
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+@pytest.mark.parametrize("sort_by", ["name", "price", "rating", "created_at"])
+async def test_pages_return_every_sweet_once_in_order(client, catalog, sort_by, sort_order, fields):
+    params = {"sort_by": sort_by, "sort_order": sort_order, **({"fields": fields} if fields else {})}
+
+    ids = await fetch_all_pages(client, limit=2, **params)
+
+    expected = sorted(SWEETS, key=lambda sweet_id: (SWEETS[sweet_id][sort_by], sweet_id), reverse=sort_order == "desc")
+    assert ids == expected
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+async def test_relevance_pages_match_the_single_page_ranking(client, catalog, sort_order):
+    params = {"search": "sweet", "sort_by": "relevance", "sort_order": sort_order}
+
+    ids = await fetch_all_pages(client, limit=2, **params)
+
+    single_page = (await client.get("/api/sweets/", params={**params, "limit": 100})).json()
+    assert ids == [sweet["id"] for sweet in single_page]
+    assert sorted(ids) == sorted(SWEETS)
+    assert ids[0 if sort_order == "asc" else -1] == "s4"
+
+
+async def test_skip_applies_after_the_cursor(client, catalog):
+    first = await client.get("/api/sweets/", params={"sort_by": "price", "limit": 2})
+
+    response = await client.get("/api/sweets/", params={
+        "sort_by": "price", "limit": 2, "skip": 1, "cursor": first.headers["X-Next-Cursor"],
+    })
+
+    # Price order is s1, s4, s0, s2, s3, s6, s5; the cursor sits after s4
+    assert [sweet["id"] for sweet in response.json()] == ["s2", "s3"]
+
+
+@pytest.mark.parametrize("other_sort", [
+    {"sort_by": "name"},
+    {"sort_by": "price", "sort_order": "desc"},
+    {"search": "sweet", "sort_by": "relevance"},
+])
+async def test_cursor_for_a_different_sort_is_rejected(client, catalog, other_sort):
+    first = await client.get("/api/sweets/", params={"sort_by": "price", "limit": 2})
+
+    response = await client.get("/api/sweets/", params={**other_sort, "cursor": first.headers["X-Next-Cursor"]})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor for this sort order"
@@ -0,0 +1,28 @@
+from models import Sweet
+
+
+async def insert_sweet(db, sweet_id: str, price: float = 10.0, stock: int = 10, category: str = "Candies"):
+    sweet = Sweet(
+        id=sweet_id,
+        name=f"Sweet {sweet_id}",
+        category=category,
+        price=price,
+        description="A test sweet",
+        image="https://example.com/sweet.jpg",
+        stock=stock,
+        weight="100g",
+    ).dict()
+    await db.sweets.insert_one(dict(sweet))
+    return sweet
+
+
+async def register(client, email: str, role: str = "user"):
+    response = await client.post("/api/auth/register", json={
+        "name": email.split("@")[0],
+        "email": email,
+        "password": "secret-password",
+        "role": role,
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body["user"]["id"], {"Authorization": f"Bearer {body['access_token']}"}